@@ -1,9 +1,35 @@
+import argparse
+
+from data.audio_writer import AudioWriterPool
+from data.chroma_cache import ChromaCache
 from data.loader import load_piast_dataset
+from data.render_cache import RenderCache
 debug = 0
+# segments per model call across files, None picks it from free memory
+batch_size = None
 
 if __name__ == '__main__':
-    dataset = load_piast_dataset(repo_path="../data/dataset/PIAST", download_if_empty=True)
+    parser = argparse.ArgumentParser()
+    # machines sharing the output directory each take one shard, e.g. --shard 0/4 ... --shard 3/4
+    parser.add_argument('--shard', default='0/1', help='i/N, the part of the dataset to generate')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes, each with its own model')
+    # decode later with: python -m data.token_store <token-dir> <output dir>
+    parser.add_argument('--token-dir', default=None, help='also keep the EnCodec tokens of every output here')
+    parser.add_argument('--profile', default=None, help='MusicGen inference profile, see utils.models.PROFILES')
+    # off by default: the melodies then go through generate_with_chroma (demucs stems + chroma) as before
+    parser.add_argument('--chroma-cache', default=None,
+                        help='cache the melody chromas here and condition on them, e.g. ../cache/chroma/')
+    args = parser.parse_args()
+    if args.profile:
+        from utils.models import set_profile
+        set_profile(args.profile)
+
+    dataset = load_piast_dataset(repo_path="../data/dataset/PIAST", download_if_empty=True, build_index=True)
     output_path = "../output/Lora/training/"
+    # rendered melodies are reused across runs and styles
+    cache = RenderCache("../cache/render/")
+    # melody conditioning is computed once per track and segment, new styles reuse it
+    chroma_cache = ChromaCache(args.chroma_cache) if args.chroma_cache else None
     print(f'get dataset {dataset}')
 
     if debug:
@@ -21,14 +47,34 @@ if __name__ == '__main__':
 
         from data.generator import generate
 
-        generate(source_path, tag, output_path, repeating_limit=1, fix_style="Rock", time_limit=1800, split_audio=10)
+        generate(source_path, tag, output_path, repeating_limit=1, fix_style="Rock", time_limit=1800, split_audio=10, cache=cache,
+                 chroma_cache=chroma_cache)
 
     else:
         subset = dataset['piast-yt']
-        source_path = subset['midi_path']
-        tag = subset['text']
+        items = list(zip(subset['midi_path'], subset['text'], subset['end_time']))
 
-        from data.generator import generate
+        if args.workers > 1 or args.shard != '0/1':
+            from data.shard_runner import parse_shard, run_sharded
+
+            shard, num_shards = parse_shard(args.shard)
+            run_sharded(items, output_path, shard, num_shards, workers=args.workers, token_dir=args.token_dir,
+                        batch_size=batch_size, time_limit=1800, split_audio=10, cache=cache,
+                        chroma_cache=chroma_cache)
+        else:
+            from data.batch_scheduler import BatchScheduler
+            from data.token_store import TokenStore
+            from utils.models import MELODY_MODEL, get_model
+
+            token_store = TokenStore(args.token_dir) if args.token_dir else None
+            # WAVs are normalized and written while the next batch is generated
+            with AudioWriterPool() as writer:
+                with BatchScheduler(get_model(MELODY_MODEL), output_path, batch_size=batch_size, time_limit=1800,
+                                    split_audio=10, cache=cache, writer=writer, token_store=token_store,
+                                    chroma_cache=chroma_cache) as scheduler:
+                    for path, text, end in items:
+                        scheduler.add(path, text, end_time=end)
 
-        for path, text in zip(source_path, tag):
-            generate(path, text, output_path, time_limit=1800, split_audio=10)
\ No newline at end of file
+            print(f'render cache: {cache.stats()}')
+            if chroma_cache is not None:
+                print(f'chroma cache: {chroma_cache.stats()}')
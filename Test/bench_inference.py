@@ -0,0 +1,118 @@
+import argparse
+import multiprocessing
+import resource
+import time
+from queue import Empty
+
+import pretty_midi
+
+from data.loader import load_piast_dataset
+
+prompt = 'Pop, solo piano cover'
+
+
+def generate(model, chroma, duration):
+    """
+    以 duration 秒的色度图生成一次，返回 (音频, token, 生成时间)；超过 max_duration 时按窗口续写
+    """
+    import torch
+
+    from data.midi_chroma import generate_with_midi_chroma
+
+    model.set_generation_params(duration=duration, use_sampling=False)
+    torch.manual_seed(0)
+    start = time.perf_counter()
+    wav, tokens = generate_with_midi_chroma(model, [prompt], [chroma], return_tokens=True)
+    return wav, tokens, time.perf_counter() - start
+
+
+def measure(profile, midi_path, durations, queue):
+    import torch
+
+    from data.midi_chroma import model_chroma
+    from utils.models import MELODY_MODEL, get_model, set_profile
+
+    set_profile(profile)
+    start = time.perf_counter()
+    model = get_model(MELODY_MODEL)
+    load_time = time.perf_counter() - start
+    midi_data = pretty_midi.PrettyMIDI(midi_path)
+    extractor = model.lm.condition_provider.conditioners['self_wav'].chroma
+
+    # warm-up, includes the compilation of the compile profiles
+    generate(model, model_chroma(model, midi_data, 1.), 1.)
+    results = []
+    for duration in durations:
+        chroma = model_chroma(model, midi_data, duration)
+        # greedy decoding (default classifier-free guidance), so the tokens of every profile can be compared
+        wav, tokens, generation_time = generate(model, chroma, duration)
+
+        # melody adherence: the conditioner's chroma of the output against the chroma it was conditioned on
+        with torch.no_grad():
+            output_chroma = extractor(wav.to(model.device))[0].cpu().numpy()
+        frames = min(len(output_chroma), len(chroma))
+        adherence = (output_chroma[:frames].argmax(axis=1) == chroma[:frames].argmax(axis=1)).mean()
+        results.append({
+            'duration': duration,
+            'generation_time': generation_time,
+            'frames': tokens.shape[-1],
+            'codebooks': tokens.shape[1],
+            'adherence': float(adherence),
+            'tokens': tokens[0].cpu().numpy(),
+        })
+
+    queue.put({
+        'load_time': load_time,
+        'results': results,
+        'peak': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    })
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('midi_path', nargs='?')
+    # the longer one is past the 30s model context, MusicGen then generates it window by window
+    parser.add_argument('--durations', type=float, nargs='+', default=[10., 40.])
+    # the first profile is the baseline the others are compared with
+    parser.add_argument('--profiles', nargs='+', default=['cpu', 'cpu-int8', 'cpu-int8-compile'])
+    args = parser.parse_args()
+
+    midi_path = args.midi_path
+    if midi_path is None:
+        dataset = load_piast_dataset(repo_path="../data/dataset/PIAST/")
+        midi_path = dataset['piast-yt']['midi_path'][0]
+    print(f'{", ".join(f"{d:.0f}s" for d in args.durations)} of {midi_path}')
+
+    baseline = None
+    # each profile runs in a fresh process so ru_maxrss is its own peak
+    for profile in args.profiles:
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=measure, args=(profile, midi_path, args.durations, queue))
+        process.start()
+        run = None
+        while run is None and process.is_alive():
+            try:
+                run = queue.get(timeout=10)
+            except Empty:
+                pass
+        if run is None:
+            # the result may have been queued just before the process exited
+            try:
+                run = queue.get(timeout=1)
+            except Empty:
+                # the traceback of the profile is printed above
+                print(f'{profile:>18}: failed with exit code {process.exitcode}')
+                continue
+        process.join()
+        if baseline is None:
+            baseline = run
+        print(f'{profile:>18}: load {run["load_time"]:.1f}s, peak RSS {run["peak"] / 1024:.0f} MB')
+        for result, base in zip(run['results'], baseline['results']):
+            frames = min(result['frames'], base['frames'])
+            agreement = (result['tokens'][:, :frames] == base['tokens'][:, :frames]).mean()
+            print(f'{result["duration"]:>18.0f}s: '
+                  f'{result["frames"] * result["codebooks"] / result["generation_time"]:.1f} tokens/s '
+                  f'({result["frames"] / result["generation_time"]:.1f} steps/s, '
+                  f'x{base["generation_time"] / result["generation_time"]:.2f}), '
+                  f'melody adherence {result["adherence"]:.3f}, '
+                  f'token agreement with {args.profiles[0]} {agreement:.3f}')
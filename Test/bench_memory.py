@@ -0,0 +1,67 @@
+import multiprocessing
+import resource
+import sys
+
+import numpy as np
+import pretty_midi
+import torch
+
+from data.loader import load_piast_dataset
+from data.mid_preprocessor import midi_to_audio_tensor
+
+sr = 44100
+
+
+def legacy(midi_path):
+    # conversion path before the float32 rewrite: float64 synth, pad/slice, divide, .float()
+    midi_data = pretty_midi.PrettyMIDI(midi_path)
+    audio_signal = midi_data.synthesize(fs=sr)
+    expected_length = int(sr * midi_data.get_end_time())
+    if len(audio_signal) < expected_length:
+        audio_signal = np.pad(audio_signal, (0, expected_length - len(audio_signal)))
+    else:
+        audio_signal = audio_signal[:expected_length]
+    audio_signal = audio_signal / np.max(np.abs(audio_signal))
+    return torch.from_numpy(audio_signal).float()
+
+
+def current(midi_path):
+    return midi_to_audio_tensor(midi_path, sr=sr, synth='pretty_midi')[0]
+
+
+def current_numpy(midi_path):
+    return midi_to_audio_tensor(midi_path, sr=sr, synth='numpy')[0]
+
+
+def current_out(midi_path):
+    duration = pretty_midi.PrettyMIDI(midi_path).get_end_time()
+    out = torch.zeros(int(sr * duration), dtype=torch.float32)
+    return midi_to_audio_tensor(midi_path, sr=sr, synth='numpy', out=out)[0]
+
+
+def measure(mode, midi_path, queue):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    audio = globals()[mode](midi_path)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((len(audio), baseline, peak))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        midi_path = sys.argv[1]
+    else:
+        dataset = load_piast_dataset(repo_path="../data/dataset/PIAST/")
+        # the longest performance in the first files is the representative worst case
+        midi_path = max(dataset['piast-yt']['midi_path'][:50],
+                        key=lambda p: pretty_midi.PrettyMIDI(p).get_end_time())
+    print(f'measuring {midi_path}')
+
+    # each mode runs in a fresh process so ru_maxrss is its own peak
+    for mode in ['legacy', 'current', 'current_numpy', 'current_out']:
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=measure, args=(mode, midi_path, queue))
+        process.start()
+        samples, baseline, peak = queue.get()
+        process.join()
+        print(f'{mode:>14}: {samples / sr:.0f}s audio, peak RSS {peak / 1024:.0f} MB '
+              f'(+{(peak - baseline) / 1024:.0f} MB over import)')
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+import time
+
+# entry modules and scripts, imported the way their callers do (scripts without running __main__)
+TARGETS = [
+    ('import', 'data.mid_preprocessor'),
+    ('import', 'data.generator'),
+    ('import', 'data.batch_scheduler'),
+    ('import', 'data.data_collection'),
+    ('run', 'main.py'),
+    ('run', 'Scripts/generate_lora_data.py'),
+    ('run', 'training/step1-preprocess.py'),
+]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child_code(kind, target):
+    if kind == 'import':
+        load = f'import importlib; importlib.import_module({target!r})'
+    else:
+        load = f'import runpy; runpy.run_path({os.path.join(ROOT, target)!r}, run_name="bench")'
+    # time and peak RSS are measured inside the child so interpreter start-up is reported separately
+    return (f'import resource, sys, time; sys.path.insert(0, {ROOT!r}); start = time.perf_counter(); {load}; '
+            f'print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, '
+            f'len(sys.modules["utils.models"].loaded_models()) if "utils.models" in sys.modules else 0)')
+
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    print(f'{"interpreter":>32}: {time.perf_counter() - start:.2f}s')
+
+    for kind, target in TARGETS:
+        result = subprocess.run([sys.executable, '-c', child_code(kind, target)], cwd=ROOT, capture_output=True,
+                                text=True)
+        if result.returncode:
+            print(f'{target:>32}: failed, {result.stderr.strip().splitlines()[-1]}')
+            continue
+        seconds, peak, models = result.stdout.split()[-3:]
+        print(f'{target:>32}: {float(seconds):.2f}s, peak RSS {int(peak) / 1024:.0f} MB, {models} models loaded')
@@ -0,0 +1,37 @@
+import time
+
+import librosa
+import numpy as np
+import pretty_midi
+
+from data import midi_synth
+from data.loader import load_piast_dataset
+
+sr = 44100
+n_files = 20
+
+if __name__ == '__main__':
+    dataset = load_piast_dataset(repo_path="../data/dataset/PIAST/")
+    subset = dataset['piast-yt']
+
+    total_old, total_new, audio_seconds = 0., 0., 0.
+    for midi_path in subset['midi_path'][:n_files]:
+        midi_data = pretty_midi.PrettyMIDI(midi_path)
+
+        start = time.perf_counter()
+        old = midi_data.synthesize(fs=sr)
+        total_old += time.perf_counter() - start
+
+        start = time.perf_counter()
+        new = midi_synth.synthesize(midi_data, fs=sr)
+        total_new += time.perf_counter() - start
+
+        audio_seconds += len(old) / sr
+        # melody conditioning only sees the chromagram, compare there
+        chroma_old = librosa.feature.chroma_stft(y=old.astype(np.float32), sr=sr)
+        chroma_new = librosa.feature.chroma_stft(y=new.astype(np.float32), sr=sr)
+        corr = np.corrcoef(chroma_old.ravel(), chroma_new.ravel())[0, 1]
+        print(f'{midi_path}: max abs diff {np.abs(old - new).max():.2e}, chroma corr {corr:.5f}')
+
+    print(f'pretty_midi: {total_old:.2f}s, numpy: {total_new:.2f}s for {audio_seconds:.0f}s of audio '
+          f'({total_old / total_new:.1f}x)')
@@ -0,0 +1,94 @@
+import sys
+
+import pretty_midi
+import torch
+from audiocraft.modules.conditioners import WavCondition
+
+from data.loader import load_piast_dataset
+from data.mid_preprocessor import midi_to_audio_tensor
+from data.midi_chroma import chroma_passthrough, generate_with_midi_chroma, melody_chroma, model_chroma
+from utils.models import MELODY_MODEL, get_model
+
+n_files = 20
+segment = 30.
+prompt = 'Pop, solo piano cover'
+
+
+def agreement(a, b):
+    """
+    两个色度图中每帧最强音级相同的帧所占比例
+    """
+    a, b = torch.as_tensor(a), torch.as_tensor(b)
+    frames = min(len(a), len(b))
+    return (a[:frames].argmax(-1) == b[:frames].argmax(-1)).float().mean().item()
+
+
+def passthrough_chroma(model, chroma):
+    """
+    经 chroma_passthrough 替换后的条件器实际使用的色度图，用来确认替换对已安装的 audiocraft 生效
+
+    与 CFG 一样在同一批里带一个空条件（长度为 0）；返回 (真实条件的色度图, 空条件的色度图)
+    """
+    conditioner = model.lm.condition_provider.conditioners['self_wav']
+    chroma = torch.as_tensor(chroma, device=model.device)
+    flat = chroma.reshape(1, 1, -1)
+    condition = WavCondition(torch.cat([flat, torch.zeros_like(flat)]),
+                             torch.tensor([len(chroma) * conditioner.chroma.winhop, 0], device=model.device),
+                             sample_rate=[conditioner.sample_rate] * 2, path=[None] * 2, seek_time=[None] * 2)
+    with chroma_passthrough(model), torch.no_grad():
+        embedding = conditioner._get_wav_embedding(condition).cpu()
+    return embedding[0], embedding[1]
+
+
+def check_generation(model, chroma, duration):
+    """
+    以色度图条件实际生成一次（默认的 CFG 会带空条件），时长超过 max_duration 时走分窗续写
+    """
+    model.set_generation_params(duration=duration)
+    _, tokens = generate_with_midi_chroma(model, [prompt], [chroma], return_tokens=True)
+    expected = int(duration * model.frame_rate)
+    if tokens.shape[-1] != expected:
+        sys.exit(f'{duration}s generation gave {tokens.shape[-1]} frames instead of {expected}')
+    print(f'{duration}s generation with classifier-free guidance: {tokens.shape[-1]} frames')
+
+
+if __name__ == '__main__':
+    dataset = load_piast_dataset(repo_path="../data/dataset/PIAST/")
+    model = get_model(MELODY_MODEL)
+    conditioner = model.lm.condition_provider.conditioners['self_wav']
+
+    # the reference is what generate_with_chroma feeds the model: demucs stems, then the chroma extractor.
+    # the bar for the note chroma is how close the same audio gets without stem separation
+    note_agreements, audio_agreements = [], []
+    for midi_path in dataset['piast-yt']['midi_path'][:n_files]:
+        midi_data = pretty_midi.PrettyMIDI(midi_path)
+        duration = min(segment, midi_data.get_end_time())
+        audio, _ = midi_to_audio_tensor(midi_path, sr=conditioner.sample_rate, duration=duration, synth='numpy')
+        reference = melody_chroma(model, audio[None], conditioner.sample_rate)
+        with torch.no_grad():
+            audio_chroma = conditioner.chroma(audio[None, None].to(model.device))[0].cpu()
+        note_chroma = model_chroma(model, midi_data, duration)
+
+        passed, null = passthrough_chroma(model, note_chroma)
+        frames = min(len(passed), len(note_chroma))
+        if not torch.equal(passed[:frames], torch.from_numpy(note_chroma[:frames])):
+            sys.exit(f'{midi_path}: the conditioner did not use the passed chroma')
+        # the null row is silent at full length: pitch class 0 under argmax, zeros otherwise
+        if null.shape != passed.shape or null[:, 1:].any() or (null[:, 0] != float(conditioner.chroma.argmax)).any():
+            sys.exit(f'{midi_path}: the null condition of classifier-free guidance is not silent')
+
+        note_agreements.append(agreement(note_chroma, reference))
+        audio_agreements.append(agreement(audio_chroma, reference))
+        print(f'{midi_path}: note chroma {note_agreements[-1]:.1%}, '
+              f'audio chroma without demucs {audio_agreements[-1]:.1%} agree with the demucs chroma')
+
+    # one short and one longer than the model context, which MusicGen generates window by window
+    midi_data = pretty_midi.PrettyMIDI(dataset['piast-yt']['midi_path'][0])
+    for duration in [5., model.max_duration + 10.]:
+        check_generation(model, model_chroma(model, midi_data, duration), duration)
+
+    note_mean = sum(note_agreements) / len(note_agreements)
+    threshold = sum(audio_agreements) / len(audio_agreements)
+    print(f'mean agreement with the demucs chroma over {len(note_agreements)} files: note chroma {note_mean:.1%}, '
+          f'audio chroma without demucs {threshold:.1%} (threshold)')
+    sys.exit(0 if note_mean >= threshold else 1)
@@ -0,0 +1,84 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from data.data_collection import YouTubePianoCoverDataset
+
+
+class YouTubeStub(BaseHTTPRequestHandler):
+    """
+    本地的 YouTube Data API 桩：search.list 和 videos.list 返回假数据，带固定延迟和按比例注入的 503/429
+    """
+    latency = .05
+    fail_rate = .1
+    pages = 4
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        time.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            status = random.choice([429, 503])
+            return self._reply(status, {'error': {'code': status, 'message': 'injected',
+                                                  'errors': [{'reason': 'rateLimitExceeded'}]}})
+        if url.path.endswith('/search'):
+            return self._reply(200, self._search(params))
+        if url.path.endswith('/videos'):
+            return self._reply(200, self._videos(params))
+        self._reply(404, {'error': {'code': 404, 'message': url.path}})
+
+    def _search(self, params):
+        page = int(params.get('pageToken') or 0)
+        query = params.get('q', '')
+        items = [{
+            'id': {'kind': 'youtube#video', 'videoId': f'{abs(hash(query)) % 10 ** 6:06d}{page:02d}{i:03d}'},
+            'snippet': {'title': f'{query} #{page}-{i}', 'channelTitle': 'stub', 'publishedAt': '2024-01-01T00:00:00Z',
+                        'description': ''},
+        } for i in range(int(params.get('maxResults', 5)))]
+        response = {'items': items}
+        if page + 1 < self.pages:
+            response['nextPageToken'] = str(page + 1)
+        return response
+
+    def _videos(self, params):
+        return {'items': [{
+            'id': video_id,
+            'contentDetails': {'duration': 'PT3M30S'},
+            'statistics': {'viewCount': '100', 'likeCount': '10', 'commentCount': '1'},
+        } for video_id in params.get('id', '').split(',') if video_id]}
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), YouTubeStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/'
+
+
+if __name__ == '__main__':
+    server, root_url = start_stub()
+    queries = [f'piano cover {i}' for i in range(16)]
+    for workers in [1, 8]:
+        builder = YouTubePianoCoverDataset('stub-key', workers=workers, youtube_root_url=root_url)
+        builder.youtube.base_delay = .05
+        # the stub has no quota, only the latency and injected errors are measured
+        builder.youtube.bucket.rate = 1e6
+        start = time.perf_counter()
+        dataset = builder.build_dataset(queries, max_results_per_query=20, result_per_search=5)
+        print(f'{workers} workers: {len(dataset)} videos in {time.perf_counter() - start:.2f}s, '
+              f'{builder.youtube.stats()}')
+        builder.close()
+    server.shutdown()
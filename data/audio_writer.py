@@ -0,0 +1,108 @@
+import queue
+import threading
+import time
+
+
+class AudioWriterPool:
+    """
+    后台写音频的线程池：响度归一化、压缩和写文件都在写线程里完成，生成过程不必等待
+
+    队列有上限，写入跟不上时 submit 会阻塞（背压）；close() 或退出 with 时会写完队列中的全部文件。
+    """
+
+    def __init__(self, workers=2, max_pending=8):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+        # seconds spent inside audio_write, summed over writer threads (thread-seconds)
+        self.write_time = 0.
+        # wall-clock seconds during which at least one writer was busy
+        self.busy_time = 0.
+        self._active = 0
+        self._busy_since = 0.
+        # seconds the caller was blocked by backpressure or by the final flush
+        self.wait_time = 0.
+        self._threads = [threading.Thread(target=self._drain, daemon=True) for _ in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def _drain(self):
+        from audiocraft.data.audio import audio_write
+
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+            stem_name, wav, sample_rate, on_done, kwargs = job
+            start = time.perf_counter()
+            with self._lock:
+                if not self._active:
+                    self._busy_since = start
+                self._active += 1
+            try:
+                audio_write(stem_name, wav, sample_rate, **kwargs)
+                if on_done is not None:
+                    on_done()
+                ok = True
+            except Exception as e:
+                print(f'unable to write {stem_name}: {e}')
+                ok = False
+            end = time.perf_counter()
+            with self._lock:
+                self.write_time += end - start
+                self._active -= 1
+                if not self._active:
+                    self.busy_time += end - self._busy_since
+                if ok:
+                    self.written += 1
+                else:
+                    self.failed += 1
+            self._queue.task_done()
+
+    def submit(self, stem_name, wav, sample_rate, on_done=None, **kwargs):
+        """
+        参数与 audiocraft.data.audio.audio_write 相同；wav 应已在 CPU 上
+
+        on_done 在文件写完后于写线程中调用（如记录到 OutputManifest）
+        """
+        if not self._threads:
+            raise RuntimeError('AudioWriterPool is closed')
+        start = time.perf_counter()
+        self._queue.put((stem_name, wav, sample_rate, on_done, kwargs))
+        self.wait_time += time.perf_counter() - start
+
+    def flush(self):
+        start = time.perf_counter()
+        self._queue.join()
+        self.wait_time += time.perf_counter() - start
+
+    def close(self):
+        if not self._threads:
+            return
+        self.flush()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def stats(self):
+        return {
+            'written': self.written,
+            'failed': self.failed,
+            'write_time': self.write_time,
+            'busy_time': self.busy_time,
+            'wait_time': self.wait_time,
+            # wall time the writers were busy while the caller kept generating; the caller only waits while
+            # some writer is busy, so this is the writer wall time minus the caller's waits
+            'hidden_time': max(self.busy_time - self.wait_time, 0.),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        print(f'audio writer: {self.stats()}')
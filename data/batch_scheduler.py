@@ -0,0 +1,241 @@
+import math
+import os
+import time
+
+import torch
+
+from data.generator import generate_batch, pick_style, prepare_conditioning, prepare_melodies, write_output
+from data.output_manifest import output_manifest
+
+
+def available_memory():
+    """
+    当前可用于生成的内存（字节）：有 GPU 时为空闲显存，否则为空闲物理内存；无法获得时返回 None
+    """
+    if torch.cuda.is_available():
+        free, _ = torch.cuda.mem_get_info()
+        return free
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        # no sysconf on Windows
+        return None
+
+
+def batch_size_for_memory(model, duration, memory_bytes=None, headroom=.8, max_batch_size=64,
+                          fallback_batch_size=4):
+    """
+    按生成时长估算一次能放下多少条：主要开销是每层 transformer 的 KV cache（CFG 时为两倍）
+
+    参数:
+        model (MusicGen): 模型
+        duration (float): 每条生成的时长（秒）
+        memory_bytes (int): 可用内存，默认用 available_memory()
+        headroom (float): 最多使用可用内存的比例
+        fallback_batch_size (int): 无法获得可用内存时（Windows 且未安装 psutil）使用的批大小
+    """
+    if memory_bytes is None:
+        memory_bytes = available_memory()
+    if memory_bytes is None:
+        print(f'free memory is unknown (pip install psutil), using batch size {fallback_batch_size}')
+        return fallback_batch_size
+    lm = model.lm
+    layers = len(lm.transformer.layers)
+    bytes_per_value = next(lm.parameters()).element_size()
+    steps = int(duration * model.frame_rate)
+    # 2 for keys and values, 2 for the conditional / unconditional pass of classifier-free guidance
+    per_item = 2 * 2 * layers * steps * lm.dim * bytes_per_value
+    return int(max(1, min(max_batch_size, memory_bytes * headroom // per_item)))
+
+
+class BatchScheduler:
+    """
+    跨文件的批量生成调度：收集多个 MIDI 的旋律片段和提示词，凑满 batch_size 后一次调用模型
+
+    同一批只能有一个生成时长：时长向上取整到 duration_bucket 秒的倍数后按 (取整时长, 采样率) 分组，
+    不切分的曲目长度各不相同也能凑成一批，较短的旋律在条件器中循环补齐，输出再截回各自的时长。
+    每条输出仍写到 {file_name}_part{idx}_{style} (split_audio) 或 {file_name}_{style}，写完后记录到输出清单。
+    """
+
+    def __init__(self, model, output_path, batch_size=None, time_limit=-1, split_audio=0, cache=None,
+                 midi_chroma=False, writer=None, manifest=None, token_store=None, chroma_cache=None,
+                 duration_bucket=5., on_done=None):
+        """
+        参数:
+            duration_bucket (float): 生成时长取整的粒度（秒），0 表示只有时长完全相同的片段才合批
+            on_done (callable): on_done(source_path, seconds, error)，某个文件的所有片段都已生成（error 为 None）
+                                或其所在的一批生成失败时调用一次；seconds 为从 add 到完成的时间
+        """
+        self.model = model
+        self.duration_bucket = duration_bucket
+        self.output_path = output_path
+        self.batch_size = batch_size
+        self.time_limit = time_limit
+        self.split_audio = split_audio
+        self.cache = cache
+        self.midi_chroma = midi_chroma
+        # data.chroma_cache.ChromaCache: melodies are conditioned on cached chromas instead of audio
+        self.chroma_cache = chroma_cache
+        # with a data.audio_writer.AudioWriterPool, normalization and file I/O run in the background
+        self.writer = writer
+        self.manifest = output_manifest(output_path) if manifest is None else manifest
+        # data.token_store.TokenStore to keep the EnCodec tokens of every output
+        self.token_store = token_store
+        self._pending = {}
+        self._auto_batch_sizes = {}
+        self.on_done = on_done
+        # source_path -> [segments not yet generated, time of add]
+        self._remaining = {}
+        self.batches = 0
+        self.generated_seconds = 0.
+        self.generation_time = 0.
+        self._started = time.perf_counter()
+
+    def add(self, source_path, tag, fix_style=None, end_time=None):
+        """
+        准备一个文件的旋律条件并排入对应的组，组满一批时立即生成；准备失败时抛出异常，
+        生成的完成或失败通过 on_done 报告
+        """
+        file_name = os.path.splitext(os.path.basename(source_path))[0]
+        added = time.perf_counter()
+        if self.manifest.runs(file_name):
+            print(f'{file_name} has been processed, skipped to next')
+            self._report(source_path, added, None)
+            return
+
+        if self.chroma_cache is not None:
+            melodies, sr, duration = prepare_conditioning(source_path, self.model, time_limit=self.time_limit,
+                                                          split_audio=self.split_audio, cache=self.cache,
+                                                          chroma_cache=self.chroma_cache,
+                                                          midi_chroma=self.midi_chroma, end_time=end_time)
+        else:
+            melodies, sr, duration = prepare_melodies(source_path, self.model, time_limit=self.time_limit,
+                                                      split_audio=self.split_audio, cache=self.cache,
+                                                      midi_chroma=self.midi_chroma, end_time=end_time)
+        # an interrupted split run continues with its style and only the missing parts
+        resumed = self.manifest.incomplete(file_name) if self.split_audio else None
+        style, done = resumed or (pick_style(file_name, self.output_path, fix_style, self.manifest), set())
+        prompt = f'{style}, {tag}'
+        generation_duration = self._bucket(duration)
+        group = self._pending.setdefault((generation_duration, sr), [])
+        queued = 0
+        for idx, melody in enumerate(melodies):
+            if idx in done:
+                continue
+            part, parts = (idx, len(melodies)) if self.split_audio else (None, None)
+            group.append((prompt, melody, (file_name, style, part, parts, duration), source_path))
+            queued += 1
+        print(f'queued {queued} segments of {file_name}-{duration}s')
+        if not queued:
+            self._report(source_path, added, None)
+            return
+        self._remaining[source_path] = [queued, added]
+
+        batch_size = self._batch_size(generation_duration)
+        while len(group) >= batch_size:
+            # taken off the group first, a failing batch drops its files' other queued segments from it
+            batch = group[:batch_size]
+            del group[:batch_size]
+            self._run(generation_duration, sr, batch)
+
+    def _bucket(self, duration):
+        if not self.duration_bucket:
+            return duration
+        bucket = math.ceil(duration / self.duration_bucket - 1e-9) * self.duration_bucket
+        # never longer than the run allows
+        if self.time_limit != -1:
+            bucket = min(bucket, max(float(self.time_limit), duration))
+        return bucket
+
+    def _batch_size(self, duration):
+        if self.batch_size is not None:
+            return self.batch_size
+        if duration not in self._auto_batch_sizes:
+            self._auto_batch_sizes[duration] = batch_size_for_memory(self.model, duration)
+            print(f'batch size {self._auto_batch_sizes[duration]} for {duration}s segments')
+        return self._auto_batch_sizes[duration]
+
+    def _report(self, source_path, added, error):
+        if self.on_done is not None:
+            self.on_done(source_path, time.perf_counter() - added, error)
+
+    def _fail(self, sources, error):
+        """
+        报告失败的文件，并丢弃它们仍在排队的片段：失败的组不会在之后的 add 中被重试
+        """
+        sources = {source for source in sources if source in self._remaining}
+        for group in self._pending.values():
+            group[:] = [item for item in group if item[3] not in sources]
+        for source in sources:
+            print(f'{source} failed: {error}')
+            self._report(source, self._remaining.pop(source)[1], error)
+
+    def _run(self, duration, sr, items):
+        """
+        生成一批；失败时只报告这一批涉及的文件，不抛出异常
+        """
+        prompts, melodies, outputs, sources = zip(*items)
+        start = time.perf_counter()
+        try:
+            self.model.set_generation_params(duration=duration)
+            wav, tokens = generate_batch(self.model, list(prompts), list(melodies), sr, return_tokens=True)
+        except Exception as e:
+            self._fail(sources, str(e))
+            return
+        self.generation_time += time.perf_counter() - start
+        for w, t, (track, style, part, parts, own_duration), source in zip(wav, tokens, outputs, sources):
+            try:
+                # cut the bucket padding off, the tail past the melody follows its looped chroma
+                w = w[0, :int(round(own_duration * self.model.sample_rate))]
+                t = t[..., :int(math.ceil(own_duration * self.model.frame_rate))]
+                write_output(self.writer, self.manifest, self.output_path, track, style, w.cpu(),
+                             self.model.sample_rate, part=part, parts=parts, tokens=t, token_store=self.token_store)
+            except Exception as e:
+                self._fail([source], str(e))
+                continue
+            self.generated_seconds += own_duration
+            remaining = self._remaining.get(source)
+            if remaining is not None:
+                remaining[0] -= 1
+                if not remaining[0]:
+                    del self._remaining[source]
+                    self._report(source, remaining[1], None)
+        self.batches += 1
+        print(f'batch {self.batches}: {len(items)} x {duration}s, {self.throughput():.3f} generated s / wall s')
+
+    def flush(self):
+        """
+        生成所有剩余的（不满一批的）片段
+        """
+        for (duration, sr), group in self._pending.items():
+            batch_size = self._batch_size(duration)
+            while group:
+                batch = group[:batch_size]
+                del group[:batch_size]
+                self._run(duration, sr, batch)
+        self._pending = {}
+
+    def throughput(self):
+        wall = time.perf_counter() - self._started
+        return self.generated_seconds / wall if wall > 0 else 0.
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'generated_seconds': self.generated_seconds,
+            'generation_time': self.generation_time,
+            'throughput': self.throughput(),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+        print(f'batch scheduler: {self.stats()}')
@@ -0,0 +1,51 @@
+import hashlib
+import json
+from collections import OrderedDict
+
+import numpy as np
+
+from data.midi_chroma import conditioner_params
+from data.render_cache import RenderCache
+
+
+class ChromaCache(RenderCache):
+    """
+    旋律条件（色度图）的缓存：进程内 LRU + 磁盘 .npy，同一首曲目的各个风格、各次运行共用
+
+    条目为形状 (segments, frames, 12) 的 float32 数组，按 chroma_key()（MIDI 内容哈希 + 条件器参数 + 分段参数）寻址。
+    """
+
+    def __init__(self, cache_dir="./cache/chroma/", max_bytes=2 * 1024 ** 3, memory_items=256):
+        super().__init__(cache_dir, max_bytes)
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+
+    def chroma_key(self, midi_path, model, time_limit=-1, split_audio=0, midi_chroma=False, duration=None):
+        """
+        由 MIDI 内容哈希、条件器参数和分段参数得到条目的键
+        """
+        with open(midi_path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        params = json.dumps([conditioner_params(model), time_limit, split_audio, midi_chroma, duration])
+        return f'{digest}-{hashlib.sha1(params.encode()).hexdigest()[:16]}'
+
+    def load(self, key, return_numpy=True):
+        if key in self._memory:
+            self.hits += 1
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        chromas = super().load(key)
+        if chromas is not None:
+            self._remember(key, np.asarray(chromas))
+        return chromas
+
+    def store(self, key, chromas):
+        chromas = np.asarray(chromas, dtype=np.float32)
+        self._remember(key, chromas)
+        super().store(key, chromas)
+
+    def _remember(self, key, chromas):
+        self._memory[key] = chromas
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
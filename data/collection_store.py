@@ -0,0 +1,140 @@
+import csv
+import json
+import os
+import threading
+
+# marker lines sit between the rows, a unit (query, batch of csv rows...) is only marked after its rows are on disk
+_DONE = '_done'
+
+
+class CollectionStore:
+    """
+    数据收集的追加写入存储（JSONL）：行先进入缓冲，每 flush_every 行追加到文件并 fsync
+
+    内存中只保留去重索引（key 列的取值集合）和已完成单元的集合，行本身只在磁盘上；
+    key 已存在的行会被跳过（例如不同搜索词返回的同一视频）。key 应由行的内容决定（视频 ID、规范化的曲名），
+    不能用行号：输入 CSV 重新生成或排序后，按行号保存的结果会对应到错误的行。进程中断后最多丢失未刷新的缓冲，
+    重新打开时跳过写了一半的最后一行，调用方根据 is_done 跳过已完成的单元继续收集。
+    """
+
+    def __init__(self, path, key='cover_id', flush_every=50):
+        self.path = path
+        self.key = key
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._keys = set()
+        self._done = set()
+        self.rows_written = 0
+        if os.path.exists(path):
+            for entry in self._entries():
+                if _DONE in entry:
+                    self._done.add(entry[_DONE])
+                elif key not in entry:
+                    # e.g. a checkpoint keyed by csv row position, its rows cannot be matched by content
+                    raise ValueError(f'{path} was written with a different key than {key!r}, '
+                                     f'use a new store or the original key')
+                else:
+                    self._keys.add(entry[key])
+                    self.rows_written += 1
+            if self.rows_written or self._done:
+                print(f'{path}: resuming after {self.rows_written} rows, {len(self._done)} completed units')
+        elif os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        if self._file.tell() and self._torn_tail():
+            # terminate the interrupted line so the next entry starts on its own
+            self._file.write('\n')
+            self._file.flush()
+
+    def _torn_tail(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b'\n'
+
+    def _entries(self):
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # the line being written when a run was interrupted
+                    continue
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, row):
+        """
+        缓冲一行，key 重复时跳过并返回 False
+        """
+        with self._lock:
+            if row[self.key] in self._keys:
+                return False
+            self._keys.add(row[self.key])
+            self._buffer.append(row)
+            if len(self._buffer) >= self.flush_every:
+                self._flush()
+        return True
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        self._file.write(''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in self._buffer))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.rows_written += sum(_DONE not in row for row in self._buffer)
+        self._buffer = []
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def mark_done(self, unit):
+        """
+        刷新缓冲并记录一个已完成的单元，之后 is_done(unit) 为 True
+        """
+        with self._lock:
+            self._buffer.append({_DONE: unit})
+            self._flush()
+            self._done.add(unit)
+
+    def is_done(self, unit):
+        return unit in self._done
+
+    def rows(self):
+        """
+        逐行读取已刷新的行，不把整个存储读入内存
+        """
+        self.flush()
+        for entry in self._entries():
+            if _DONE not in entry:
+                yield entry
+
+    def to_csv(self, filename):
+        """
+        流式导出为 CSV，列为各行字段的并集（按首次出现的顺序）
+        """
+        columns = {}
+        for row in self.rows():
+            columns.update(dict.fromkeys(row))
+        with open(filename, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(columns))
+            writer.writeheader()
+            for row in self.rows():
+                writer.writerow(row)
+        print(f"{self.rows_written} rows have been saved to {filename}")
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,46 +1,57 @@
-import ast
 import json
 import re
 import time
+import unicodedata
 from datetime import datetime
-from fuzzywuzzy import fuzz, process
 
-import pandas as pd
-from google import genai
-from google.genai import types
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from data.response_cache import OfflineCacheMiss
+from data.youtube_client import YouTubeClient
 from utils.config import getAPIValue
 
+# google / pandas / numpy are imported where they are used, importing this module stays cheap
+
 
 class YouTubePianoCoverDataset:
-    def __init__(self, youtube_api, google_llm_api):
-        self.youtube = build('youtube', 'v3', developerKey=youtube_api)
-        self.client = genai.Client(api_key=google_llm_api)
+    def __init__(self, youtube_api, google_llm_api=None, workers=8, youtube_root_url=None, cache=None):
+        """
+        workers: 同时进行的 API 请求数
+        youtube_root_url: YouTube Data API 的地址，测试时指向本地桩服务器
+        cache: data.response_cache.ResponseCache，YouTube 和 Gemini 的响应缓存；重复或续跑的收集不再重复请求，
+               offline=True 时可在没有 API key 的情况下回放
+        """
+        self.cache = cache
+        self.youtube = YouTubeClient(youtube_api, workers=workers, root_url=youtube_root_url, cache=cache)
+        if google_llm_api is not None:
+            from google import genai
+            self.client = genai.Client(api_key=google_llm_api)
         self.dataset = []
 
     def search_piano_covers(self, query, max_results=50, result_per_search=50):
+        from googleapiclient.errors import HttpError
+
         target_len = max_results
         next_token = None
         result_set = []
+        # pages of one query depend on each other, different queries run concurrently (see build_dataset)
         while target_len > 0:
             result = min(result_per_search, target_len)
 
             try:
-                search_response = self.youtube.search().list(
+                search_response = self.youtube.search(
                     q=query,
                     pageToken=next_token,
                     part='snippet',
                     maxResults=result,
                     type='video',
                     videoDuration='medium',  # 中等长度视频 (4-20分钟)
-                ).execute()
+                )
 
                 result_set.extend(search_response.get('items', []))
                 next_token = search_response.get('nextPageToken')
 
                 target_len -= result_per_search
-                time.sleep(0.1)
+                if not next_token:
+                    break
             except HttpError as e:
                 print(f'An HTTP error occurred: {e}')
                 return result_set
@@ -50,11 +61,13 @@ class YouTubePianoCoverDataset:
         """
         获取视频详细信息
         """
+        from googleapiclient.errors import HttpError
+
         try:
-            video_response = self.youtube.videos().list(
+            video_response = self.youtube.videos(
                 part='snippet,contentDetails,statistics',
                 id=video_id
-            ).execute()
+            )
 
             return video_response.get('items', [])[0] if video_response.get('items') else None
 
@@ -62,207 +75,357 @@ class YouTubePianoCoverDataset:
             print(f'An HTTP error occurred: {e}')
             return None
 
+    def get_videos_details(self, video_ids, batch_size=50):
+        """
+        批量获取视频详细信息：每次 videos().list 最多查询 50 个 ID（1 个配额单位），各批并发请求
+
+        返回:
+            dict: video_id -> 视频信息（contentDetails 和 statistics），获取失败的 ID 不在其中
+        """
+        from googleapiclient.errors import HttpError
+
+        video_ids = list(dict.fromkeys(video_ids))
+        batches = [video_ids[i:i + batch_size] for i in range(0, len(video_ids), batch_size)]
+
+        def fetch(batch):
+            try:
+                # maxResults is not supported together with id, the 50 ids already bound the response
+                return self.youtube.videos(part='contentDetails,statistics', id=','.join(batch)).get('items', [])
+            except HttpError as e:
+                print(f'An HTTP error occurred: {e}')
+                return []
+
+        details = {item['id']: item for items in self.youtube.map(fetch, batches) for item in items}
+        print(f"got details of {len(details)}/{len(video_ids)} videos in {len(batches)} requests")
+        return details
+
+    @staticmethod
+    def _details_columns(details, prefix):
+        if details is None:
+            return {}
+        statistics = details.get('statistics', {})
+        return {
+            f'{prefix}_duration': details.get('contentDetails', {}).get('duration'),
+            f'{prefix}_view_count': statistics.get('viewCount', 0),
+            f'{prefix}_like_count': statistics.get('likeCount', 0),
+            f'{prefix}_comment_count': statistics.get('commentCount', 0),
+        }
+
     def get_video_url(self, video_id):
         return f"https://www.youtube.com/watch?v={video_id}"
 
-    def build_dataset(self, queries, max_results_per_query=20, result_per_search=50):
+    def build_dataset(self, queries, max_results_per_query=20, result_per_search=50, video_details=True, store=None):
         """
         构建数据集
-        """
-        for query in queries:
-            print(f"querying: {query}")
-            videos = self.search_piano_covers(query, max_results_per_query, result_per_search)
-
-            for video in videos:
-                video_id = video['id']['videoId']
-                print(f"process video: {video['snippet']['title']} (ID: {video_id})")
-
-                # enable video_details: not recommended due to high api cost
-                # video_details = self.get_video_details(video_id)
-                # if not video_details:
-                # continue
-                # time.sleep(0.1)
-
-                # 生成URL
-                video_url = self.get_video_url(video_id)
-
-                # 收集数据
-                data_entry = {
-                    'cover_id': video_id,
-                    'cover_title': video['snippet']['title'],
-                    'cover_channel': video['snippet']['channelTitle'],
-                    'cover_publish_date': video['snippet']['publishedAt'],
-                    'cover_description': video['snippet']['description'],
-                    # 'cover_duration': video_details['contentDetails']['duration'],
-                    # 'cover_view_count': video_details['statistics'].get('viewCount', 0),
-                    # 'cover_like_count': video_details['statistics'].get('likeCount', 0),
-                    # 'cover_comment_count': video_details['statistics'].get('commentCount', 0),
-                    'search_query': query,
-                    'collected_date': datetime.now().isoformat(),
-                    'video_url': video_url,
-                }
 
-                self.dataset.append(data_entry)
+        video_details: 批量获取时长和统计数据（cover_duration、cover_view_count 等列），
+                       每 50 个视频只需 1 个配额单位
+        store: data.collection_store.CollectionStore，给出时行写入该存储而不是 self.dataset，
+               每完成一组搜索词就刷新到磁盘；中断后用同一存储重跑会跳过已完成的搜索词
+        """
+        print(f"querying: {queries}")
+        seen = {entry['cover_id'] for entry in self.dataset}
+        pending = [query for query in queries if store is None or not store.is_done(f'search:{query}')]
+        if len(pending) < len(queries):
+            print(f"skipping {len(queries) - len(pending)} completed queries")
+
+        # one group of concurrent searches at a time, only its results are held in memory
+        step = max(1, self.youtube.workers)
+        for group in [pending[i:i + step] for i in range(0, len(pending), step)]:
+            results = self.youtube.map(
+                lambda q: self.search_piano_covers(q, max_results_per_query, result_per_search), group)
+            details = {}
+            if video_details:
+                details = self.get_videos_details(video['id']['videoId'] for videos in results for video in videos)
+
+            for query, videos in zip(group, results):
+
+                for video in videos:
+                    video_id = video['id']['videoId']
+                    # the same video is often returned by several queries
+                    if video_id in seen or (store is not None and video_id in store):
+                        continue
+                    print(f"process video: {video['snippet']['title']} (ID: {video_id})")
+
+                    # 生成URL
+                    video_url = self.get_video_url(video_id)
+
+                    # 收集数据
+                    data_entry = {
+                        'cover_id': video_id,
+                        'cover_title': video['snippet']['title'],
+                        'cover_channel': video['snippet']['channelTitle'],
+                        'cover_publish_date': video['snippet']['publishedAt'],
+                        'cover_description': video['snippet']['description'],
+                        **self._details_columns(details.get(video_id), 'cover'),
+                        'search_query': query,
+                        'collected_date': datetime.now().isoformat(),
+                        'video_url': video_url,
+                    }
+
+                    if store is None:
+                        seen.add(video_id)
+                        self.dataset.append(data_entry)
+                    else:
+                        store.add(data_entry)
+
+                if store is not None:
+                    store.mark_done(f'search:{query}')
+
+        return self.dataset if store is None else store
+
+    def extract_name(self, titles, model="gemini-2.5-flash"):
+        """
+        用 LLM 提取一批视频标题中的曲名，回复为按行号索引的结构化 JSON
 
-        return self.dataset
+        参数:
+            titles (dict): 行号 -> 视频标题
 
-    def extract_name(self, titles, time_delay=0.1):
+        返回:
+            dict: 行号 -> 曲名（无法识别时为 None）；回复不是合法 JSON 或缺少行号时抛出 ValueError，
+                  这样的回复不会被缓存
+        """
+        items = [{'index': int(index), 'title': title} for index, title in titles.items()]
         contents = f'you are a music collection assistant, please extract the EXACT music name without adding any ' \
                    f'authors\' name from the following video titles, considering carefully about the music name words and ' \
-                   f'formats. return in List format:{titles}'
-        # print(contents)
-
-        response = self.client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=contents,
-            config=types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(thinking_budget=0)  # Disables thinking
-            ),
-        )
-        cleaned_text = re.sub(r'^[^\[]*|[^\]]*$', '', response.text)
-        print(cleaned_text)
-        time.sleep(time_delay)
-        return ast.literal_eval(cleaned_text)
-
-    def extract_original_title(self, csv_file_path, overwrite=False, batch_size=50, similarity_threshold=0.7):
-        df = pd.read_csv(csv_file_path)
-        start_idx = 0
-        names = []
+                   f'formats. answer one object per title with its index, use null when the title names no music:' \
+                   f'{json.dumps(items, ensure_ascii=False)}'
+
+        def generate():
+            from google.genai import types
+
+            schema = types.Schema(type=types.Type.ARRAY, items=types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    'index': types.Schema(type=types.Type.INTEGER),
+                    'name': types.Schema(type=types.Type.STRING, nullable=True),
+                },
+                required=['index', 'name'],
+            ))
+            response = self.client.models.generate_content(
+                model=model,
+                contents=contents,
+                config=types.GenerateContentConfig(
+                    thinking_config=types.ThinkingConfig(thinking_budget=0),  # Disables thinking
+                    response_mime_type='application/json',
+                    response_schema=schema,
+                ),
+            )
+            # validated before it is returned, a malformed reply raises and is never cached
+            return self._parse_names(response.text, titles)
+
+        if self.cache is not None:
+            entries = self.cache.fetch('gemini', {'model': model, 'thinking_budget': 0, 'schema': 'index-name-v2',
+                                                  'contents': contents}, generate)
+        else:
+            entries = generate()
+        names = {index: name for index, name in entries}
+        return {index: names[int(index)] for index in titles}
+
+    @staticmethod
+    def _parse_names(text, titles):
+        """
+        解析 extract_name 的回复，返回 [[行号, 曲名], ...]（可 JSON 序列化，供缓存）
+        """
+        try:
+            names = {int(entry['index']): entry.get('name') for entry in json.loads(text)}
+        except (TypeError, ValueError, KeyError, AttributeError) as e:
+            raise ValueError(f'malformed reply: {text[:200]}') from e
+        missing = set(int(index) for index in titles) - set(names)
+        if missing:
+            raise ValueError(f'reply is missing rows {sorted(missing)}')
+        return [[int(index), names[int(index)]] for index in titles]
+
+    def _extract_batch(self, titles, max_retries=2, retry_delay=1.):
+        """
+        extract_name 失败时重试，重试用尽后将批次一分为二分别提取，单个标题仍失败时其结果为 None
+        """
+        for attempt in range(max_retries + 1):
+            try:
+                return self.extract_name(titles)
+            except OfflineCacheMiss:
+                # an offline replay cannot succeed by asking again
+                raise
+            except Exception as e:
+                print(f"error when communicating with LLM ({len(titles)} titles, attempt {attempt + 1}): {e}")
+                if attempt < max_retries:
+                    time.sleep(retry_delay * 2 ** attempt)
+        if len(titles) == 1:
+            return {index: None for index in titles}
+        keys = list(titles)
+        half = len(keys) // 2
+        names = self._extract_batch({k: titles[k] for k in keys[:half]}, max_retries, retry_delay)
+        names.update(self._extract_batch({k: titles[k] for k in keys[half:]}, max_retries, retry_delay))
+        return names
+
+    @staticmethod
+    def _match_names(batch_titles, extracted_names, similarity_threshold):
+        """
+        用编辑距离将提取的曲名与原标题单调对齐，返回与 batch_titles 等长的列表（未对齐为 NA）
+        """
+        import pandas as pd
 
-        if not overwrite and 'original_song' in df.columns:
-            non_empty_mask = df['original_song'].notna() & (df['original_song'] != '')
-            if non_empty_mask.any():
-                start_idx = non_empty_mask.sum()
-                names = list(df['original_song'])[0:start_idx]
-                print(f"starting from {start_idx}")
+        from data.title_alignment import align_names
 
-        titles = df['cover_title']
-        if len(titles) == start_idx: return
-        titles_split = [titles[i:i + batch_size] for i in range(start_idx, len(titles), batch_size)]
+        batch_titles = list(batch_titles)
+        matched, scores = align_names(extracted_names, batch_titles, similarity_threshold)
+        for original_title, name, score in zip(batch_titles, matched, scores):
+            if name is None:
+                print(f"failed: '{original_title}'")
+            else:
+                print(f"matched: '{name}' -> '{original_title}' (similarity: {score:.0%})")
+        return [pd.NA if name is None else name for name in matched]
 
-        try:
-            for batch_idx, batch_titles in enumerate(titles_split):
-                # 提取当前批次的名称
-                extracted_names = self.extract_name(batch_titles)
-
-                # 处理每个提取的名称
-                batch_results = []
-                retire_list = []
-                for i, (original_title, extracted_name) in enumerate(zip(batch_titles, extracted_names)):
-                    # check availability
-                    if not extracted_name or pd.isna(extracted_name):
-                        batch_results.append(pd.NA)
-                        continue
+    def extract_original_title(self, csv_file_path, overwrite=False, batch_size=50, similarity_threshold=0.7,
+                               llm_workers=4, max_retries=2):
+        """
+        提取每个翻奏视频对应的原曲名，写入 original_song 列
 
-                    # add to matching list
-                    retire_list.append(extracted_name)
-
-                    failed = False
-                    # using edit distance, check all failed name before corresponding pair,
-                    # remove matched name and everything before it
-                    for n in retire_list:
-                        similarity = fuzz.partial_ratio(n.lower(), original_title.lower())
-
-                        # test similarity
-                        if (similarity / 100) >= similarity_threshold:
-                            failed = False
-                            batch_results.append(extracted_name)
-                            # clean everything before the success matching
-                            retire_list = retire_list[retire_list.index(n) + 1:]
-                            print(f"matched: '{n}' -> '{original_title}' (similarity: {similarity}%)")
-                            continue
-                        else:
-                            failed = True
-                            print(f"failed: '{n}' -> '{original_title}' (similarity: {similarity}%)")
-
-                    if failed:
-                        batch_results.append(pd.NA)
-
-                names.extend(batch_results)
-        except Exception as e:
-            print(f"error when communicating with LLM {e} \n saving solved work...")
-            pass
-        print(names)
-
-        name_df = pd.DataFrame(names, columns=['original_song'])
-        combined_df = pd.concat([df, name_df], axis=1)
+        各批次在 llm_workers 个线程中并发请求，结果按行号写回；某一批失败时重试或拆半，不影响其它批次。
+        overwrite=False 时只处理 original_song 为空的行。
+        """
+        import pandas as pd
+        from concurrent.futures import ThreadPoolExecutor, as_completed
 
-        # save
-        output_filename = f"piano_covers_with_original_titles.csv"
-        combined_df.to_csv(output_filename, index=False, encoding='utf-8')
+        df = pd.read_csv(csv_file_path)
+        if overwrite or 'original_song' not in df.columns:
+            df['original_song'] = pd.NA
+        df['original_song'] = df['original_song'].astype(object)
 
-        print(f"new data set have been saved to {output_filename}")
-        return combined_df
+        pending = df.index[df['original_song'].isna() | (df['original_song'] == '')]
+        if not len(pending):
+            return
+        print(f"extracting {len(pending)}/{len(df)} titles")
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
 
-    def find_original_songs(self, csv_file_path, max_results_per_song=1, top_n=-1):
+        def process(rows):
+            names = self._extract_batch(dict(zip(rows, df.loc[rows, 'cover_title'])), max_retries)
+            return rows, self._match_names(df.loc[rows, 'cover_title'], [names[row] for row in rows],
+                                           similarity_threshold)
+
+        output_filename = f"piano_covers_with_original_titles.csv"
+        # at most llm_workers batches are in flight
+        executor = ThreadPoolExecutor(max_workers=llm_workers)
+        try:
+            for future in as_completed([executor.submit(process, rows) for rows in batches]):
+                try:
+                    rows, batch_results = future.result()
+                except OfflineCacheMiss:
+                    raise
+                except Exception as e:
+                    # the rows stay empty, a rerun on the saved csv extracts them again
+                    print(f"error when extracting a batch: {e}")
+                    continue
+                df.loc[rows, 'original_song'] = batch_results
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            # save solved work, also when the run is interrupted
+            df.to_csv(output_filename, index=False, encoding='utf-8')
+            print(f"new data set have been saved to {output_filename}")
+        print(df['original_song'].tolist())
+        return df
+
+    @staticmethod
+    def normalize_song_title(title):
         """
-        根据CSV文件中的original_song_title字段搜索原曲视频
+        曲名的规范化形式（NFKC、忽略大小写、标点视为空白、压缩空白），写法不同的同一首歌得到相同的值；
+        空值或没有文字时返回 None
         """
-        k = top_n
-        df = pd.read_csv(csv_file_path)
+        if not isinstance(title, str):
+            return None
+        # python's re, \w covers every script (the arrow-backed pandas string methods only match ASCII)
+        title = re.sub(r'[^\w\s]|_', ' ', unicodedata.normalize('NFKC', title).casefold())
+        return ' '.join(title.split()) or None
 
-        original_songs_data = []
+    def find_original_songs(self, csv_file_path, max_results_per_song=1, top_n=-1, video_details=True, store=None,
+                            chunk_size=50):
+        """
+        根据CSV文件中的original_song_title字段搜索原曲视频
 
-        for index, row in df.iterrows():
-            original_song_title = row['original_song']
+        同一首歌（规范化后的 original_song 相同）只搜索一次，结果合并回所有对应的行，
+        API 调用次数与不同歌曲的数量成正比，而不是行数。
 
-            # 跳过空值或无效的歌曲标题
-            if pd.isna(original_song_title) or not original_song_title.strip():
-                print(f"跳过第 {index + 1} 行: 无有效原曲标题")
-                original_songs_data.append({})
-                continue
+        video_details: 批量获取原曲的时长和统计数据（original_duration、original_view_count 等列）
+        store: data.collection_store.CollectionStore(key='song_key')，每搜索完 chunk_size 首歌就把结果刷新到磁盘，
+               中断后用同一存储重跑只搜索还没有结果的歌
+        """
+        import pandas as pd
 
-            print(f"搜索原曲: {original_song_title} (第 {index + 1}/{len(df)} 行)")
+        df = pd.read_csv(csv_file_path)
 
+        # 跳过空值或无效的歌曲标题
+        song_keys = df['original_song'].map(self.normalize_song_title)
+        # the first spelling of every song is the one searched for
+        songs = pd.DataFrame({'song_key': song_keys, 'title': df['original_song']})[song_keys.notna()]
+        songs = songs.drop_duplicates('song_key')
+        if top_n >= 0:
+            # top_n counts songs, every row of a selected song gets its result
+            songs = songs.head(top_n + 1)
+        titled = song_keys.isin(songs['song_key'])
+        songs = list(songs.itertuples(index=False, name=None))
+        if store is not None:
+            songs = [song for song in songs if song[0] not in store]
+        print(f"searching {len(songs)} unique original songs for {titled.sum()} of {len(df)} rows")
+
+        def search(song):
+            song_key, original_song_title = song
             # 搜索原曲视频
             try:
                 # 添加"official"等关键词提高找到原曲的概率
-                search_query = f"{original_song_title} official"
+                search_query = f"{original_song_title.strip()} official"
                 search_results = self.search_piano_covers(search_query, max_results=max_results_per_song)
 
                 if not search_results:
                     print(f"未找到原曲: {original_song_title}")
-                    original_songs_data.append({})
-                    continue
+                    return {'song_key': song_key}
 
-                # 获取第一个结果的详细信息
+                # 第一个结果的详细信息在同一组搜索完成后批量获取
                 original_video_id = search_results[0]['id']['videoId']
-                # original_video_details = self.get_video_details(original_video_id)
-
-                # if not original_video_details:
-                # print(f"无法获取原曲详情: {original_song_title}")
-                # original_songs_data.append({})
-                # continue
 
                 # 提取原曲信息
                 original_data = {
+                    'song_key': song_key,
                     'original_video_id': original_video_id,
                     'original_title': search_results[0]['snippet']['title'],
                     'original_publish_date': search_results[0]['snippet']['publishedAt'],
                     'original_description': search_results[0]['snippet']['description'],
-                    # 'original_duration': original_video_details['contentDetails']['duration'],
-                    # 'original_comment_count': original_video_details['statistics'].get('commentCount', 0),
                     'original_video_url': self.get_video_url(original_video_id),
                     'original_search_query': search_query
                 }
 
-                original_songs_data.append(original_data)
                 print(f"find origin: {original_data['original_title']}")
+                return original_data
 
             except Exception as e:
+                # not recorded, a resumed run searches the song again
                 print(f"error when finding origin: {e}")
-                original_songs_data.append({})
+                return None
 
-            # avoid api restriction
-            time.sleep(0.1)
-            if k > 0:
-                k -= 1
-            elif k == 0:
-                break
-
-        # combine to DataFrame
-        original_df = pd.DataFrame(original_songs_data)
-        combined_df = pd.concat([df, original_df], axis=1)
+        original_songs_data = []
+        for chunk in [songs[i:i + chunk_size] for i in range(0, len(songs), chunk_size)]:
+            found = [data for data in self.youtube.map(search, chunk) if data is not None]
+            if video_details:
+                details = self.get_videos_details(d['original_video_id'] for d in found if 'original_video_id' in d)
+                for original_data in found:
+                    if 'original_video_id' in original_data:
+                        original_data.update(self._details_columns(details.get(original_data['original_video_id']),
+                                                                   'original'))
+            if store is None:
+                original_songs_data.extend(found)
+            else:
+                for original_data in found:
+                    store.add(original_data)
+                store.flush()
+
+        # broadcast every song's result to all of its rows; rows without a title or beyond top_n stay empty
+        if store is not None:
+            original_songs_data = store.rows()
+        original_df = pd.DataFrame(list(original_songs_data))
+        if 'song_key' not in original_df.columns:
+            original_df = pd.DataFrame(columns=['song_key'])
+        original_df = original_df.drop_duplicates('song_key')
+        combined_df = df.assign(song_key=song_keys.where(titled)).merge(original_df, on='song_key', how='left')
+        combined_df = combined_df.drop(columns='song_key')
 
         # save
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -276,6 +439,8 @@ class YouTubePianoCoverDataset:
         """
         保存数据集到CSV文件
         """
+        import pandas as pd
+
         if not self.dataset:
             print("没有数据可保存")
             return
@@ -296,6 +461,12 @@ class YouTubePianoCoverDataset:
             json.dump(self.dataset, f, ensure_ascii=False, indent=2)
         print(f"数据集已保存到 {filename}")
 
+    def close(self):
+        """
+        关闭 YouTube 客户端的线程池
+        """
+        self.youtube.close()
+
 
 # 使用示例
 if __name__ == "__main__":
@@ -308,14 +479,18 @@ if __name__ == "__main__":
         "piano version",
     ]
 
-    # create constructor
-    dataset_builder = YouTubePianoCoverDataset(API_KEY)
+    # create constructor, reruns are answered from the response cache
+    from data.collection_store import CollectionStore
+    from data.response_cache import ResponseCache
+
+    dataset_builder = YouTubePianoCoverDataset(API_KEY, cache=ResponseCache())
 
-    # build dataset
-    dataset = dataset_builder.build_dataset(search_queries, max_results_per_query=200)
+    # build dataset, an interrupted run continues from the last completed query
+    with CollectionStore('piano_covers_dataset.jsonl') as store:
+        dataset_builder.build_dataset(search_queries, max_results_per_query=200, store=store)
 
-    # save to csv
-    dataset_builder.save_to_csv()
-    dataset_builder.save_to_json()
+        # save to csv
+        store.to_csv('piano_covers_dataset.csv')
 
-    print(f"collect {len(dataset)} piano covers")
+        print(f"collect {len(store)} piano covers")
+    dataset_builder.close()
@@ -0,0 +1,203 @@
+import multiprocessing
+import os
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pretty_midi
+
+# per-process synthesizer, created once by _init_worker
+_synth = None
+_sfid = None
+_fs = None
+
+
+def render_instrument(synth, sfid, instrument, fs):
+    """
+    用常驻的 fluidsynth.Synth 渲染单个乐器，事件处理与 pretty_midi.Instrument.fluidsynth 相同
+    """
+    if len(instrument.notes) == 0:
+        return np.array([], dtype=np.float32)
+
+    if instrument.is_drum:
+        channel = 9
+        if synth.program_select(channel, sfid, 128, instrument.program) == -1:
+            synth.program_select(channel, sfid, 128, 0)
+    else:
+        channel = 0
+        synth.program_select(channel, sfid, 0, instrument.program)
+
+    event_list = []
+    for note in instrument.notes:
+        event_list += [[note.start, 'note on', note.pitch, note.velocity]]
+        event_list += [[note.end, 'note off', note.pitch]]
+    for bend in instrument.pitch_bends:
+        event_list += [[bend.time, 'pitch bend', bend.pitch]]
+    for control_change in instrument.control_changes:
+        event_list += [[control_change.time, 'control change', control_change.number, control_change.value]]
+    event_list.sort(key=lambda x: (x[0], x[1] != 'note off'))
+
+    current_time = event_list[0][0]
+    next_event_times = [e[0] for e in event_list[1:]]
+    for event, end in zip(event_list[:-1], next_event_times):
+        event[0] = end - event[0]
+    # 1 second of release at the end
+    event_list[-1][0] = 1.
+    total_time = current_time + np.sum([e[0] for e in event_list])
+    synthesized = np.zeros(int(np.ceil(fs * total_time)), dtype=np.float32)
+
+    for event in event_list:
+        if event[1] == 'note on':
+            synth.noteon(channel, event[2], event[3])
+        elif event[1] == 'note off':
+            synth.noteoff(channel, event[2])
+        elif event[1] == 'pitch bend':
+            synth.pitch_bend(channel, event[2])
+        elif event[1] == 'control change':
+            synth.cc(channel, event[2], event[3])
+        current_sample = int(fs * current_time)
+        end = int(fs * (current_time + event[0]))
+        synthesized[current_sample:end] += synth.get_samples(end - current_sample)[::2]
+        current_time += event[0]
+
+    # the synth outlives this file, clear voices and controllers for the next one
+    synth.system_reset()
+    return synthesized
+
+
+def render_midi(synth, sfid, midi_data, fs):
+    """
+    与 PrettyMIDI.fluidsynth 相同：逐乐器渲染后相加并归一化
+    """
+    waveforms = [render_instrument(synth, sfid, i, fs) for i in midi_data.instruments]
+    if len(waveforms) == 0 or max(w.shape[0] for w in waveforms) == 0:
+        return np.array([], dtype=np.float32)
+    synthesized = np.zeros(max(w.shape[0] for w in waveforms), dtype=np.float32)
+    for waveform in waveforms:
+        synthesized[:waveform.shape[0]] += waveform
+    peak = np.abs(synthesized).max()
+    if peak > 0:
+        synthesized /= peak
+    return synthesized
+
+
+def _init_worker(soundfont_path, sr):
+    global _synth, _sfid, _fs
+    import fluidsynth
+    _synth = fluidsynth.Synth(samplerate=float(sr))
+    _sfid = _synth.sfload(soundfont_path)
+    _fs = sr
+
+
+def _render_job(midi_path):
+    try:
+        midi_data = pretty_midi.PrettyMIDI(midi_path)
+        audio = render_midi(_synth, _sfid, midi_data, _fs)
+    except Exception as e:
+        print(f'unable to render {midi_path}: {e}')
+        return None
+    # the end time comes along, so the caller never has to parse the file itself
+    end_time = midi_data.get_end_time()
+    if len(audio) == 0:
+        return '', 0, end_time
+    shm = SharedMemory(create=True, size=audio.nbytes)
+    np.ndarray(audio.shape, dtype=np.float32, buffer=shm.buf)[:] = audio
+    # ownership moves to the parent, which unlinks the segment after attaching
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    shm.close()
+    return shm.name, len(audio), end_time
+
+
+class FluidSynthPool:
+    """
+    常驻 SoundFont 的 fluidsynth 渲染进程池
+
+    每个 worker 只在启动时加载一次 soundfont，render_batch 并行渲染一批 MIDI，
+    结果通过共享内存返回，在 release() 或 close() 之前有效。
+    """
+
+    def __init__(self, soundfont_path, sr=44100, workers=None):
+        if not os.path.exists(soundfont_path):
+            raise FileNotFoundError(f'soundfont not found: {soundfont_path}')
+        self.soundfont_path = soundfont_path
+        self.sr = sr
+        self.workers = workers or os.cpu_count()
+        self._segments = []
+        self._pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                          initargs=(soundfont_path, sr))
+
+    def render_batch(self, midi_paths, return_end_times=False):
+        """
+        并行渲染一批 MIDI 文件（MIDI 在 worker 中解析）
+
+        返回:
+            list: 与 midi_paths 对应的 float32 数组，渲染失败的位置为 None
+            list: return_end_times 时另返回各文件的 MIDI 结束时间（秒），失败的位置为 None
+        """
+        results, end_times = [], []
+        for job in self._pool.map(_render_job, midi_paths, chunksize=1):
+            if job is None:
+                results.append(None)
+                end_times.append(None)
+                continue
+            name, length, end_time = job
+            end_times.append(end_time)
+            if length == 0:
+                results.append(np.array([], dtype=np.float32))
+                continue
+            shm = SharedMemory(name=name)
+            # the mapping stays valid after unlink, the name is no longer needed
+            shm.unlink()
+            self._segments.append(shm)
+            results.append(np.ndarray((length,), dtype=np.float32, buffer=shm.buf))
+        if return_end_times:
+            return results, end_times
+        return results
+
+    def render(self, midi_path, return_end_time=False):
+        """
+        渲染单个文件，返回普通数组（不占用共享内存）；批量渲染请用 render_batch
+        """
+        (audio,), (end_time,) = self.render_batch([midi_path], return_end_times=True)
+        if audio is not None:
+            audio = audio.copy()
+            self.release()
+        if return_end_time:
+            return audio, end_time
+        return audio
+
+    def release(self):
+        """
+        释放之前返回的共享内存，调用前需丢弃对结果数组的引用
+        """
+        remaining = []
+        for shm in self._segments:
+            try:
+                shm.close()
+            except BufferError:
+                # still referenced by a caller
+                remaining.append(shm)
+        self._segments = remaining
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self.release()
+
+    def terminate(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
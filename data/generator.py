@@ -1,12 +1,12 @@
 import os
-import random
 
 import pretty_midi
-import torch
-from audiocraft.data.audio import audio_write
-from audiocraft.models import MusicGen
 
 from data.mid_preprocessor import midi_to_audio_tensor
+from data.long_form import generate_long_form
+from data.midi_chroma import generate_with_midi_chroma, melody_chroma, model_chroma
+from data.output_manifest import output_manifest
+from utils.models import MELODY_MODEL, get_model
 
 styles = ['Pop', 'Synth-pop', 'Dance Pop', 'Pop Rock', 'Electropop', 'Hip-Hop', 'Rap', 'Boom-Bap', 'Trap', 'Jazz Rap',
           'Drill', 'Emo Rap', 'Rock', 'Punk Rock', 'Alternative Rock', 'Indie Rock', 'Hard Rock', 'Electronic', 'EDM',
@@ -16,66 +16,244 @@ styles = ['Pop', 'Synth-pop', 'Dance Pop', 'Pop Rock', 'Electropop', 'Hip-Hop',
           'Classical', 'Baroque', 'Romantic', 'Modern Classical', 'Metal', 'Heavy Metal', 'Death Metal', 'Black Metal',
           'Metalcore', 'Folk', 'Traditional Folk', 'Contemporary Folk', 'Folk Rock', 'Latin', 'Reggaeton', 'Salsa',
           'Bachata', 'Latin Pop', 'K-Pop', 'Blues', 'Delta Blues', 'Chicago Blues', 'Electric Blues', 'World']
-a_model = MusicGen.get_pretrained('facebook/musicgen-melody-large')
 
 
-def generate(source_path, tag: str, output_path, fix_style=None, repeating_limit=1, model=a_model, time_limit=-1, split_audio=0):
-    file_name = os.path.splitext(os.path.basename(source_path))[0]
-    i = 0
-    for f in os.listdir(output_path):
-        if file_name in f:
-            i += 1
-        if i >= repeating_limit:
-            print(f'{file_name} has processed {repeating_limit} times, skipped to next')
-            return
+def __getattr__(name):
+    # a_model used to be loaded at import time, it now comes from the registry on first access
+    if name == 'a_model':
+        return get_model(MELODY_MODEL)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-    while i < repeating_limit:
-        i += 1
 
-        midi_data = pretty_midi.PrettyMIDI(source_path)
-        duration = midi_data.get_end_time() if time_limit == -1 else min(float(time_limit), midi_data.get_end_time())
-        print(f'processing {file_name}-{duration}s...')
+def prepare_melodies(source_path, model=None, time_limit=-1, split_audio=0, cache=None, midi_chroma=False,
+                     end_time=None):
+    """
+    准备旋律条件：split_audio 时为最多 split_audio 段 time_limit 秒的片段，否则为前 duration 秒
 
-        audio_tensor, sr = midi_to_audio_tensor(
-            source_path,
-            debug=False,
-            save_audio=False,
-            visualize=False,
-        )
+    返回:
+        melodies (list): 形状为 (1, samples) 的音频片段；midi_chroma 时为 (frames, 12) 的色度图
+        sr (int): 音频采样率，midi_chroma 时为 None
+        duration (float): 生成时长（秒）
+    """
+    if model is None:
+        model = get_model(MELODY_MODEL)
+    # end_time from the dataset's midi index saves parsing the file just for its length
+    midi_data = pretty_midi.PrettyMIDI(source_path) if midi_chroma or end_time is None else None
+    if end_time is None:
+        end_time = midi_data.get_end_time()
+    duration = end_time if time_limit == -1 else min(float(time_limit), end_time)
 
-        audio_segments = []
+    if midi_chroma:
+        # melody conditioning straight from the notes, no synthesis or STFT
         if split_audio:
-            segment_samples = int(time_limit * sr)
-            total_samples = len(audio_tensor)
-            num_segments = min(total_samples // segment_samples, split_audio)
+            num_segments = min(int(end_time // time_limit), split_audio)
+            chromas = [model_chroma(model, midi_data, time_limit, start=idx * time_limit)
+                       for idx in range(num_segments)]
+            print(f"split into {len(chromas)} chromas")
+        else:
+            chromas = [model_chroma(model, midi_data, duration)]
+        return chromas, None, duration
 
-            for i in range(num_segments):
-                start_idx = i * segment_samples
-                end_idx = start_idx + segment_samples
-                segment = audio_tensor[start_idx:end_idx]
-                audio_segments.append(segment.expand(1, -1))
+    # only render what is used below: split_audio windows of time_limit seconds, or the first duration seconds
+    render_duration = min(split_audio * time_limit, end_time) if split_audio else duration
+    audio_tensor, sr = midi_to_audio_tensor(
+        source_path,
+        duration=render_duration,
+        debug=False,
+        save_audio=False,
+        visualize=False,
+        synth='numpy',
+        cache=cache,
+    )
 
-            print(f"split into {len(audio_segments)} audios")
-        else:
-            audio_tensor = audio_tensor[:int(sr*duration)]
+    audio_segments = []
+    if split_audio:
+        segment_samples = int(time_limit * sr)
+        total_samples = len(audio_tensor)
+        num_segments = min(total_samples // segment_samples, split_audio)
+
+        for idx in range(num_segments):
+            start_idx = idx * segment_samples
+            end_idx = start_idx + segment_samples
+            segment = audio_tensor[start_idx:end_idx]
+            audio_segments.append(segment.expand(1, -1))
+
+        print(f"split into {len(audio_segments)} audios")
+    else:
+        audio_segments.append(audio_tensor[:int(sr*duration)].expand(1, -1))
+    return audio_segments, sr, duration
+
+
+def prepare_conditioning(source_path, model=None, time_limit=-1, split_audio=0, cache=None, chroma_cache=None,
+                         midi_chroma=False, end_time=None):
+    """
+    与 prepare_melodies 相同，但旋律条件总是色度图（返回的 sr 为 None）
+
+    音频旋律的色度图与 generate_with_chroma 内部计算的相同；有 chroma_cache（data.chroma_cache.ChromaCache）时
+    每个 (曲目, 片段) 只合成、计算一次，换风格或重复运行都直接读取。
+    """
+    if model is None:
+        model = get_model(MELODY_MODEL)
+    if end_time is None:
+        end_time = pretty_midi.PrettyMIDI(source_path).get_end_time()
+    duration = end_time if time_limit == -1 else min(float(time_limit), end_time)
+    key = None
+    if chroma_cache is not None:
+        key = chroma_cache.chroma_key(source_path, model, time_limit, split_audio, midi_chroma, end_time)
+        chromas = chroma_cache.load(key)
+        if chromas is not None:
+            return list(chromas), None, duration
+
+    melodies, sr, duration = prepare_melodies(source_path, model, time_limit=time_limit, split_audio=split_audio,
+                                              cache=cache, midi_chroma=midi_chroma, end_time=end_time)
+    chromas = melodies if sr is None else [melody_chroma(model, melody, sr) for melody in melodies]
+    if key is not None and chromas:
+        chroma_cache.store(key, chromas)
+    return chromas, None, duration
+
+
+def pick_style(file_name, output_path, fix_style=None, manifest=None):
+    """
+    选一个该曲目还没有生成过的风格
+    """
+    if manifest is None:
+        manifest = output_manifest(output_path)
+    return manifest.unused_style(file_name, styles, fix_style)
+
+
+def output_name(track, style, part=None):
+    return f'{track}_part{part}_{style}' if part is not None else f'{track}_{style}'
+
+
+def write_output(writer, manifest, output_path, track, style, wav, sample_rate, part=None, parts=None,
+                 tokens=None, token_store=None):
+    """
+    写出一条生成结果，写完后记录到清单；writer 为 AudioWriterPool 时在后台写
+
+    token_store 为 data.token_store.TokenStore 时，同时以相同的输出名保存形状为 [codebooks, frames] 的 tokens
+    """
+    name = output_name(track, style, part)
+    if token_store is not None:
+        # stored before the WAV is recorded, a finished output always has its tokens
+        token_store.put(name, tokens)
+
+    def done():
+        manifest.record(track, style, part, parts)
+
+    if writer is None:
+        from audiocraft.data.audio import audio_write
+        audio_write(f'{output_path}/{name}', wav, sample_rate, strategy="loudness", loudness_compressor=True)
+        done()
+    else:
+        writer.submit(f'{output_path}/{name}', wav, sample_rate, on_done=done, strategy="loudness",
+                      loudness_compressor=True)
+
+
+def generate_batch(model, prompts, melodies, sr, return_tokens=False):
+    """
+    用一次模型调用生成一批；sr 为 None 时 melodies 是色度图
+    """
+    if sr is None:
+        return generate_with_midi_chroma(model, prompts, melodies, return_tokens=return_tokens)
+    return model.generate_with_chroma(prompts, melodies, sr, return_tokens=return_tokens)
+
+
+def generate_styles(source_path, tag: str, output_path, style_list, model=None, time_limit=-1, split_audio=0,
+                    cache=None, chroma_cache=None, midi_chroma=False, end_time=None, batch_size=None, writer=None,
+                    manifest=None, token_store=None):
+    """
+    一首曲目生成多个风格：旋律条件只准备一次，(风格, 片段) 组合按 batch_size 一批批送入模型
+
+    参数:
+        style_list (list): 要生成的风格，已在清单中完成的（风格, 片段）跳过
+        batch_size (int): 每次模型调用的条数，默认全部放进一次调用
+    """
+    file_name = os.path.splitext(os.path.basename(source_path))[0]
+    if model is None:
+        model = get_model(MELODY_MODEL)
+    if manifest is None:
+        manifest = output_manifest(output_path)
+    parts = split_audio or None
+    todo = [style for style in style_list if not manifest.is_done(file_name, style)]
+    if not todo:
+        print(f'{file_name} has all {len(style_list)} styles, skipped to next')
+        return
+
+    chromas, _, duration = prepare_conditioning(source_path, model, time_limit=time_limit, split_audio=split_audio,
+                                                cache=cache, chroma_cache=chroma_cache, midi_chroma=midi_chroma,
+                                                end_time=end_time)
+    items = [(style, idx) for style in todo for idx in range(len(chromas))
+             if not (parts and manifest.is_done(file_name, style, idx))]
+    print(f'processing {file_name}-{duration}s in {len(todo)} styles, {len(items)} outputs...')
+    model.set_generation_params(duration=duration)
+    batch_size = batch_size or len(items)
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        wav, tokens = generate_batch(model, [f'{style}, {tag}' for style, _ in batch],
+                                     [chromas[idx] for _, idx in batch], None, return_tokens=True)
+        for (style, idx), w, t in zip(batch, wav, tokens):
+            write_output(writer, manifest, output_path, file_name, style, w[0].cpu(), model.sample_rate,
+                         part=idx if parts else None, parts=len(chromas) if parts else None, tokens=t,
+                         token_store=token_store)
+
+
+def generate(source_path, tag: str, output_path, fix_style=None, repeating_limit=1, model=None, time_limit=-1, split_audio=0,
+             cache=None, midi_chroma=False, end_time=None, writer=None, manifest=None, long_form=None,
+             token_store=None, chroma_cache=None):
+    """
+    writer: data.audio_writer.AudioWriterPool 时响度归一化和写文件在后台进行
+    manifest: 记录已完成输出的 OutputManifest，默认为 output_path 下的 manifest.jsonl
+    long_form: 不分段且时长超过 long_form 秒时，用 data.long_form 按该长度的重叠窗口生成
+    token_store: data.token_store.TokenStore，同时保存每条输出的 EnCodec token
+    chroma_cache: data.chroma_cache.ChromaCache，旋律条件以色度图缓存，跨运行和风格复用
+    """
+    file_name = os.path.splitext(os.path.basename(source_path))[0]
+    if model is None:
+        model = get_model(MELODY_MODEL)
+    if manifest is None:
+        manifest = output_manifest(output_path)
+    i = manifest.runs(file_name)
+    if i >= repeating_limit:
+        print(f'{file_name} has processed {repeating_limit} times, skipped to next')
+        return
+
+    # the melody conditioning is the same for every repetition, only the style changes
+    if chroma_cache is not None:
+        melodies, sr, duration = prepare_conditioning(source_path, model, time_limit=time_limit,
+                                                      split_audio=split_audio, cache=cache,
+                                                      chroma_cache=chroma_cache, midi_chroma=midi_chroma,
+                                                      end_time=end_time)
+    else:
+        melodies, sr, duration = prepare_melodies(source_path, model, time_limit=time_limit, split_audio=split_audio,
+                                                  cache=cache, midi_chroma=midi_chroma, end_time=end_time)
+    while i < repeating_limit:
+        i += 1
+        print(f'processing {file_name}-{duration}s...')
 
         model.set_generation_params(duration=duration)  # generate 8 seconds.
-        style = random.choice(styles)
-        if not fix_style:
-            while f'{file_name}_{style}.wav' in os.listdir(output_path):
-                st = style
-                style = random.choice(styles)
-                print(f'{file_name}_{st}.wav already exist, trying {style}')
+        # an interrupted split run continues with its style and only the missing parts
+        resumed = manifest.incomplete(file_name) if split_audio else None
+        if resumed:
+            style, done = resumed
+            print(f'resuming {file_name} in {style}, {len(done)} parts already written')
         else:
-            style = fix_style
+            style, done = pick_style(file_name, output_path, fix_style, manifest), set()
         prompt = f'{style}, {tag}'
         # generates using the melody from the given audio and the provided descriptions.
         if split_audio:
-            wav = model.generate_with_chroma([prompt] * len(audio_segments), audio_segments, sr)
-            for idx, w in enumerate(wav):
-                audio_write(f'{output_path}/{file_name}_part{idx}_{style}', w[0].cpu(), model.sample_rate, strategy="loudness",
-                            loudness_compressor=True)
+            parts = [idx for idx in range(len(melodies)) if idx not in done]
+            wav, tokens = generate_batch(model, [prompt] * len(parts), [melodies[idx] for idx in parts], sr,
+                                         return_tokens=True)
+            for idx, w, t in zip(parts, wav, tokens):
+                write_output(writer, manifest, output_path, file_name, style, w[0].cpu(), model.sample_rate,
+                             part=idx, parts=len(melodies), tokens=t, token_store=token_store)
+        elif long_form and duration > long_form:
+            wav, timings, tokens = generate_long_form(model, prompt, melodies[0], sr, duration, window=long_form,
+                                                      return_tokens=True)
+            print(f'{file_name}: {len(timings)} windows in {sum(t["seconds"] for t in timings):.1f}s')
+            write_output(writer, manifest, output_path, file_name, style, wav, model.sample_rate, tokens=tokens[0],
+                         token_store=token_store)
         else:
-            wav, token = model.generate_with_chroma([prompt], audio_tensor.expand(1, -1, -1), sr, return_tokens=True)
-            audio_write(f'{output_path}/{file_name}_{style}', wav[0].cpu(), model.sample_rate, strategy="loudness",
-                        loudness_compressor=True)
+            wav, tokens = generate_batch(model, [prompt], melodies, sr, return_tokens=True)
+            write_output(writer, manifest, output_path, file_name, style, wav[0].cpu(), model.sample_rate,
+                         tokens=tokens[0], token_store=token_store)
@@ -1,14 +1,19 @@
-import os
+import hashlib
 import json
 import os
+import shutil
 
 import pandas as pd
 from datasets import DatasetDict, Dataset
 
+from data.midi_index import INDEX_COLUMNS, build_midi_index
+
+# bump when the layout of the built rows changes, older snapshots are then rebuilt
+SNAPSHOT_VERSION = 3
 
-def load_piast_dataset(repo_path="./dataset/PIAST/", download_if_empty=False):  # --- 加载 piast-at ---
-    global Dataset
 
+def load_piast_dataset(repo_path="./dataset/PIAST/", download_if_empty=False, build_index=False,
+                       index_workers=None, snapshot=True):  # --- 加载 piast-at ---
     try:
         if (not os.path.isdir(repo_path) or len(os.listdir(repo_path)) == 0) and download_if_empty:
             from git import Repo, GitCommandError
@@ -20,101 +25,152 @@ def load_piast_dataset(repo_path="./dataset/PIAST/", download_if_empty=False):
         return
 
     try:
-        # 构建数据集
-        dataset_dict = {}
-
-        # 处理 piast-at 部分
-        at_path = f'{repo_path}piast_at/'
-        if os.path.exists(at_path):
-            print("processing piast-at ...")
-
-            # 加载文本数据
-            text_df = pd.read_csv(os.path.join(at_path, "at_text.csv"))
-            with open(os.path.join(at_path, "at_caption.json"), "r", encoding='UTF-8') as f:
-                caption_data = json.load(f)
-            # with open(os.path.join(at_path, "tag_list.json"), "r", encoding='UTF-8') as f:
-            # tag_data = json.load(f)
-
-            # 加载 MIDI 文件信息
-            midi_dir = os.path.join(at_path, "midi")
-            midi_files = []
-            if os.path.exists(midi_dir):
-                midi_files = [f for f in os.listdir(midi_dir) if f.endswith('.mid') or f.endswith('.midi')]
-
-            # 创建 piast-at 数据集
-            at_data = {
-                "id": [],
-                "text": [],
-                # "caption": [],
-                "midi_path": []
-            }
-
-            # 假设文本数据和MIDI文件有某种对应关系
-            # 这里需要根据实际数据结构调整
-            for i, row in text_df.iterrows():
-                at_data["id"].append(i)
-                # at_data["text"].append(row.get("text", ""))
-
-                # 获取对应的caption
-                caption = caption_data[i]["caption"].replace(";", ",").split(",")
-                at_data["text"].append(caption)
-
-                # 获取对应的tags
-                # tags = tag_data.get(str(i), []) if isinstance(tag_data, dict) else []
-                # at_data["tags"].append(tags)
-
-                name = row.get("AudioFile", i)
-                # 获取对应的MIDI文件路径
-                midi_path = os.path.join(midi_dir, f"{name}.mid") if i < len(midi_files) else ""
-                at_data["midi_path"].append(midi_path if os.path.exists(midi_path) else "")
-
-            # 创建数据集
-            from datasets import Dataset
-            at_dataset = Dataset.from_dict(at_data)
-            dataset_dict["piast-at"] = at_dataset
-
-        # 处理 piast-yt 部分
-        yt_path = os.path.join(repo_path, "piast_yt")
-        if os.path.exists(yt_path):
-            print("processing piast-yt...")
-
-            # 加载文本数据
-            with open(os.path.join(yt_path, "youtube.json"), "r", encoding='UTF-8') as f:
-                yt_data = json.load(f)
-
-            # 加载 MIDI 文件信息
-            midi_dir = os.path.join(yt_path, "midi")
-            midi_files = []
-            if os.path.exists(midi_dir):
-                midi_files = [f for f in os.listdir(midi_dir) if f.endswith('.mid') or f.endswith('.midi')]
-
-            # 创建 piast-yt 数据集
-            yt_dataset_data = {
-                "id": [],
-                "text": [],
-                "midi_path": []
-            }
-
-            for i, item in enumerate(yt_data):
-                midi_path = os.path.join(midi_dir, f"{item['track_id']}.mid") if i < len(midi_files) else ""
-
-                if midi_path == "" or not os.path.exists(midi_path):
-                    continue
-                yt_dataset_data["id"].append(i)
-                yt_dataset_data["text"].append(item['tag'][0].split(","))
-                yt_dataset_data["midi_path"].append(midi_path)
-
-            # 创建数据集
-            yt_dataset = Dataset.from_dict(yt_dataset_data)
-            dataset_dict["piast-yt"] = yt_dataset
-
-        return DatasetDict(dataset_dict)
+        # 构建数据集：每个子集的快照带有源文件指纹，指纹不变时直接内存映射读取，只重建变化的子集
+        dataset = {}
+        snapshot_path = os.path.join(repo_path, "snapshot") if snapshot else None
+        index_path = os.path.join(repo_path, "midi_index.parquet")
+
+        for name, split_path, source_files, build in [
+            # piast-at is joined by concatenation as it always was, repo_path is expected to end with a separator
+            ("piast-at", f'{repo_path}piast_at/', ["at_text.csv", "at_caption.json"], _build_at),
+            ("piast-yt", os.path.join(repo_path, "piast_yt"), ["youtube.json"], _build_yt),
+        ]:
+            if not os.path.exists(split_path):
+                continue
+            fingerprint = _fingerprint([os.path.join(split_path, f) for f in source_files],
+                                       os.path.join(split_path, "midi"), [repo_path, build_index])
+            split_snapshot = os.path.join(snapshot_path, name) if snapshot_path else None
+            if split_snapshot and _snapshot_fingerprint(split_snapshot) == fingerprint:
+                dataset[name] = Dataset.load_from_disk(split_snapshot)
+                continue
+
+            print(f"processing {name} ...")
+            data = build(split_path)
+            # MIDI 元数据索引（结束时间、音符数等），保存在数据集目录下，后续加载只解析新增或修改的文件
+            if build_index:
+                index = build_midi_index(data["midi_path"], index_path=index_path, workers=index_workers)
+                rows = index.reindex(data["midi_path"])
+                for column in INDEX_COLUMNS:
+                    data[column] = [None if pd.isna(p) else (v.tolist() if hasattr(v, "tolist") else v)
+                                    for p, v in zip(rows["midi_path"], rows[column])]
+            dataset[name] = Dataset.from_dict(data)
+            if split_snapshot:
+                _save_snapshot(dataset[name], split_snapshot, fingerprint)
+
+        return DatasetDict(dataset)
 
     except Exception as e:
         print(f"loading failed: {e}")
         return None
 
 
+def _midi_names(midi_dir):
+    """
+    MIDI 目录下的文件名集合，用于 O(1) 判断某条记录是否有对应的 MIDI
+    """
+    if not os.path.exists(midi_dir):
+        return set()
+    return {f for f in os.listdir(midi_dir) if f.endswith('.mid') or f.endswith('.midi')}
+
+
+def _build_at(at_path):
+    # 加载文本数据
+    text_df = pd.read_csv(os.path.join(at_path, "at_text.csv"))
+    with open(os.path.join(at_path, "at_caption.json"), "r", encoding='UTF-8') as f:
+        caption_data = json.load(f)
+    # with open(os.path.join(at_path, "tag_list.json"), "r", encoding='UTF-8') as f:
+    # tag_data = json.load(f)
+
+    # 加载 MIDI 文件信息
+    midi_dir = os.path.join(at_path, "midi")
+    midi_names = _midi_names(midi_dir)
+
+    # 创建 piast-at 数据集
+    at_data = {
+        "id": [],
+        "text": [],
+        # "caption": [],
+        "midi_path": []
+    }
+
+    audio_files = text_df["AudioFile"] if "AudioFile" in text_df.columns else text_df.index
+    for i, name in zip(text_df.index, audio_files):
+        at_data["id"].append(i)
+
+        # 获取对应的caption
+        caption = caption_data[i]["caption"].replace(";", ",").split(",")
+        at_data["text"].append(caption)
+
+        # 获取对应的MIDI文件路径，没有对应文件时为空
+        at_data["midi_path"].append(os.path.join(midi_dir, f"{name}.mid") if f"{name}.mid" in midi_names else "")
+    return at_data
+
+
+def _build_yt(yt_path):
+    # 加载文本数据
+    with open(os.path.join(yt_path, "youtube.json"), "r", encoding='UTF-8') as f:
+        yt_data = json.load(f)
+
+    # 加载 MIDI 文件信息
+    midi_dir = os.path.join(yt_path, "midi")
+    midi_names = _midi_names(midi_dir)
+
+    # 创建 piast-yt 数据集
+    yt_dataset_data = {
+        "id": [],
+        "text": [],
+        "midi_path": []
+    }
+
+    for i, item in enumerate(yt_data):
+        if f"{item['track_id']}.mid" not in midi_names:
+            continue
+        yt_dataset_data["id"].append(i)
+        yt_dataset_data["text"].append(item['tag'][0].split(","))
+        yt_dataset_data["midi_path"].append(os.path.join(midi_dir, f"{item['track_id']}.mid"))
+    return yt_dataset_data
+
+
+def _fingerprint(source_files, midi_dir, params):
+    """
+    子集源文件的指纹：文本文件和每个 MIDI 文件的 (名字, 修改时间, 大小)，加上影响结果的参数
+    """
+    digest = hashlib.sha1(json.dumps([SNAPSHOT_VERSION] + params).encode())
+    for path in source_files:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f'{path}:{stat.st_mtime_ns}:{stat.st_size}\n'.encode())
+    if os.path.isdir(midi_dir):
+        for entry in sorted(os.scandir(midi_dir), key=lambda e: e.name):
+            stat = entry.stat()
+            digest.update(f'{entry.name}:{stat.st_mtime_ns}:{stat.st_size}\n'.encode())
+    return digest.hexdigest()
+
+
+def _snapshot_fingerprint(snapshot_path):
+    try:
+        with open(os.path.join(snapshot_path, "fingerprint.json"), "r", encoding='UTF-8') as f:
+            return json.load(f)["fingerprint"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def _save_snapshot(dataset, snapshot_path, fingerprint):
+    tmp_path = f'{snapshot_path}.{os.getpid()}.tmp'
+    try:
+        dataset.save_to_disk(tmp_path)
+        # written last, a snapshot without it is never used
+        with open(os.path.join(tmp_path, "fingerprint.json"), "w", encoding='UTF-8') as f:
+            json.dump({"fingerprint": fingerprint}, f)
+        if os.path.exists(snapshot_path):
+            shutil.rmtree(snapshot_path)
+        os.replace(tmp_path, snapshot_path)
+    except OSError as e:
+        # e.g. another process replaced it at the same time, the next load rebuilds it
+        print(f'unable to save dataset snapshot to {snapshot_path}: {e}')
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
 if __name__ == "__main__":
     dataset = load_piast_dataset()
     print(dataset)
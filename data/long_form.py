@@ -0,0 +1,124 @@
+import time
+
+import torch
+
+from data.midi_chroma import conditioner_params, generate_with_midi_chroma
+
+
+def window_spans(duration, window, overlap):
+    """
+    长曲目的生成窗口：(起始秒, 时长)，相邻窗口重叠 overlap 秒，最后一个窗口可能更短
+    """
+    if overlap >= window:
+        raise ValueError(f'overlap ({overlap}s) must be shorter than the window ({window}s)')
+    spans = [(0., min(window, duration))]
+    covered = spans[0][1]
+    while covered < duration:
+        start = covered - overlap
+        length = min(window, duration - start)
+        spans.append((start, length))
+        covered = start + length
+    return spans
+
+
+def slice_melody(model, melody, sr, start, length):
+    """
+    取出 [start, start + length) 秒的旋律条件；sr 为 None 时 melody 是整首的 (frames, 12) 色度图
+    """
+    if sr is not None:
+        return melody[..., int(start * sr):int((start + length) * sr)]
+    sample_rate, _, hop, _ = conditioner_params(model)
+    first = int(round(start * sample_rate / hop))
+    # same frame count as midi_to_chroma for a window of this length
+    return melody[first:first + 1 + int(length * sample_rate) // hop]
+
+
+def _window_tokens(model, description, melody, sr, prompt_tokens, progress):
+    if sr is None:
+        _, tokens = generate_with_midi_chroma(model, [description], [melody], progress=progress, return_tokens=True,
+                                              prompt_tokens=prompt_tokens)
+        return tokens
+    # MusicGen.generate_with_chroma, with the tail of the previous window as prompt tokens
+    from audiocraft.data.audio_utils import convert_audio
+
+    melody = convert_audio(melody, sr, model.sample_rate, model.audio_channels)
+    attributes, _ = model._prepare_tokens_and_attributes([description], None, melody_wavs=[melody])
+    return model._generate_tokens(attributes, prompt_tokens, progress)
+
+
+def crossfade(previous, current, samples):
+    """
+    previous 的最后 samples 个采样与 current 的前 samples 个采样做等功率交叉淡化，结果写回 previous
+    """
+    samples = min(samples, previous.shape[-1], current.shape[-1])
+    # previous[..., -0:] would be the whole tensor
+    if samples <= 0:
+        return previous
+    t = torch.linspace(0, 1, samples, device=previous.device)
+    fade_in = torch.sin(t * torch.pi / 2)
+    fade_out = torch.cos(t * torch.pi / 2)
+    previous[..., -samples:] = previous[..., -samples:] * fade_out + current[..., :samples] * fade_in
+    return previous
+
+
+def generate_long_form(model, description, melody, sr, duration, window=30., overlap=10., fade=1.,
+                       max_duration=None, progress=False, return_tokens=False):
+    """
+    按固定长度的重叠窗口生成长曲目，显存占用只取决于窗口长度
+
+    每个窗口以对应时间段的旋律为条件，并以前一窗口最后 overlap 秒的 token 为前缀续写；
+    各窗口分别解码后，在重叠区末尾做 fade 秒的交叉淡化拼接。
+
+    参数:
+        model (MusicGen): 旋律模型
+        description (str): 文本提示
+        melody: 整首的旋律条件，形状为 (1, samples) 的音频（sr 为其采样率）或 sr 为 None 时的色度图
+        duration (float): 生成时长（秒）
+        window (float): 每个窗口的时长，不能超过模型的 max_duration
+        overlap (float): 相邻窗口重叠（作为续写前缀）的时长，须小于 window；为 0 时各窗口独立生成并直接拼接
+        fade (float): 交叉淡化时长，不超过 overlap
+        max_duration (float): 总时长上限
+        return_tokens (bool): 同时返回整首的 token（去掉各窗口重复的前缀，CPU 上）
+
+    返回:
+        wav (torch.Tensor): 形状为 [channels, samples] 的音频（CPU 上）
+        timings (list): 每个窗口的 {'start', 'duration', 'seconds'}
+        tokens (torch.Tensor): return_tokens 时为形状 [1, codebooks, frames] 的 token
+    """
+    if window > model.max_duration:
+        raise ValueError(f'window ({window}s) is longer than the model context ({model.max_duration}s)')
+    if overlap < 0 or window <= overlap:
+        raise ValueError(f'overlap ({overlap}s) must be in [0, window) for a window of {window}s')
+    if max_duration is not None:
+        duration = min(duration, max_duration)
+    fade = min(fade, overlap, window - overlap)
+    overlap_tokens = int(overlap * model.frame_rate)
+    overlap_samples = int(overlap * model.sample_rate)
+    fade_samples = int(fade * model.sample_rate)
+
+    pieces, token_pieces, timings = [], [], []
+    prompt_tokens = None
+    model_duration = model.duration
+    try:
+        for idx, (start, length) in enumerate(window_spans(duration, window, overlap)):
+            begin = time.perf_counter()
+            model.duration = length
+            tokens = _window_tokens(model, description, slice_melody(model, melody, sr, start, length), sr,
+                                    prompt_tokens, progress)
+            wav = model.generate_audio(tokens)[0].cpu()
+            if return_tokens:
+                token_pieces.append((tokens[..., overlap_tokens:] if pieces else tokens).cpu())
+            # only the last overlap seconds are carried over, the KV cache never outgrows one window;
+            # without overlap each window starts fresh (tokens[..., -0:] would carry the whole window)
+            prompt_tokens = tokens[..., -overlap_tokens:] if overlap_tokens > 0 else None
+            if pieces:
+                crossfade(pieces[-1], wav[..., overlap_samples - fade_samples:overlap_samples], fade_samples)
+                wav = wav[..., overlap_samples:]
+            pieces.append(wav)
+            timings.append({'start': start, 'duration': length, 'seconds': time.perf_counter() - begin})
+            print(f'window {idx}: {start:.0f}s-{start + length:.0f}s in {timings[-1]["seconds"]:.1f}s')
+    finally:
+        model.duration = model_duration
+    if return_tokens:
+        return torch.cat(pieces, dim=-1), timings, torch.cat(token_pieces, dim=-1)
+    return torch.cat(pieces, dim=-1), timings
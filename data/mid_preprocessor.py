@@ -1,16 +1,16 @@
-import librosa
 import pretty_midi
 import numpy as np
 import torch
 import os
 from pathlib import Path
 
-from audiocraft.data.audio import audio_write
+from data import midi_synth
 
 
 def midi_to_audio_tensor(midi_path, sr=44100, duration=None, return_numpy=False,
                         debug=False, debug_dir="debug_output", save_audio=False,
-                        visualize=False, normalize=True, soundfont_path=None):
+                        visualize=False, normalize=True, soundfont_path=None, synth='pretty_midi',
+                        cache=None, fluid_pool=None, offset=0., out=None):
     """
     将 MIDI 文件转换为音频形式的张量，并提供调试选项
 
@@ -18,15 +18,20 @@ def midi_to_audio_tensor(midi_path, sr=44100, duration=None, return_numpy=False,
         midi_path (str): MIDI 文件的路径
         sr (int): 采样率，默认为 22050
         duration (float): 音频持续时间（秒），如果为None则使用MIDI文件的持续时间
+        offset (float): 起始时间（秒），返回 [offset, offset + duration) 区间的音频
         return_numpy (bool): 如果为True，返回numpy数组；否则返回PyTorch张量
         debug (bool): 是否启用调试模式
         debug_dir (str): 调试输出目录
         save_audio (bool): 是否保存音频文件
         visualize (bool): 是否生成可视化图表
         normalize (bool): 是否归一化音频信号
+        synth (str): 未使用SoundFont时的内置合成器，'pretty_midi' 或 'numpy'（data.midi_synth，速度更快）
+        cache (data.render_cache.RenderCache): 渲染缓存，命中时直接返回内存映射的结果（调试模式下不使用）
+        fluid_pool (data.fluid_pool.FluidSynthPool): 常驻SoundFont的渲染进程池，需与soundfont_path和sr一致
+        out (numpy.ndarray或torch.Tensor): 预先分配的 float32 一维缓冲区，长度至少为 sr * duration，结果直接写入其中
 
     返回:
-        audio_tensor (torch.Tensor或numpy.ndarray): 形状为 (samples,) 的音频张量
+        audio_tensor (torch.Tensor或numpy.ndarray): 形状为 (samples,) 的 float32 音频张量，给定 out 时与 out 共享内存
         sr (int): 采样率
     """
     try:
@@ -34,8 +39,27 @@ def midi_to_audio_tensor(midi_path, sr=44100, duration=None, return_numpy=False,
         if debug and not os.path.exists(debug_dir):
             os.makedirs(debug_dir)
 
+        # 查询渲染缓存
+        cache_key = None
+        if cache is not None and not debug:
+            cache_key = cache.key(midi_path, sr, soundfont_path, normalize, duration, synth, offset)
+            cached = cache.load(cache_key, return_numpy=out is not None or return_numpy)
+            if cached is not None:
+                if out is None:
+                    return cached, sr
+                audio_signal = _fit_length(cached, len(cached), _as_array(out))
+                return (audio_signal if return_numpy else torch.from_numpy(audio_signal)), sr
+
+        # 进程池中的合成器已加载好SoundFont，MIDI 也在进程池中解析
+        pooled = None
+        if fluid_pool is not None and soundfont_path and os.path.exists(soundfont_path):
+            _check_pool(fluid_pool, soundfont_path, sr)
+            pooled = fluid_pool.render(midi_path, return_end_time=True)
+            if pooled[0] is None:
+                raise RuntimeError(f"fluid_pool failed to render {midi_path}")
+
         # 加载MIDI文件
-        midi_data = pretty_midi.PrettyMIDI(midi_path)
+        midi_data = pretty_midi.PrettyMIDI(midi_path) if pooled is None or debug else None
 
         # 调试信息：打印MIDI文件基本信息
         if debug:
@@ -46,43 +70,56 @@ def midi_to_audio_tensor(midi_path, sr=44100, duration=None, return_numpy=False,
                 print(f"    乐器 {i}: 程序={instrument.program}, 是否为鼓={instrument.is_drum}, 音符数量={len(instrument.notes)}")
 
         # 获取MIDI文件的持续时间
-        midi_duration = midi_data.get_end_time()
+        midi_duration = pooled[1] if pooled is not None else midi_data.get_end_time()
 
         # 如果未指定持续时间，使用MIDI文件的完整持续时间
         if duration is None:
-            duration = midi_duration
+            duration = max(midi_duration - offset, 0.)
+        expected_length = int(sr * duration)
+        out_array = None if out is None else _as_array(out)
 
         # 使用SoundFont合成音频（如果提供了SoundFont路径）
+        windowed = False
         if soundfont_path and os.path.exists(soundfont_path):
             if debug:
                 print(f"使用SoundFont合成音频: {soundfont_path}")
 
-            # 使用fluidsynth合成音频
-            import fluidsynth
-            sf = fluidsynth.Synth()
-            sf.start()
-
-            # 合成音频
-            audio_signal = midi_data.fluidsynth(fs=sr, sf2_path=soundfont_path)
+            if pooled is not None:
+                audio_signal = pooled[0]
+            else:
+                # 合成音频
+                audio_signal = midi_data.fluidsynth(fs=sr, sf2_path=soundfont_path)
 
         else:
             if debug and soundfont_path:
                 print(f"警告: SoundFont文件不存在: {soundfont_path}，使用内置合成器")
             # 使用内置合成器
-            audio_signal = midi_data.synthesize(fs=sr)
+            if synth == 'numpy':
+                # 只渲染需要的时间窗口
+                start_sample = int(sr * offset)
+                audio_signal = midi_synth.render_samples(
+                    midi_synth.collect_notes(midi_data, sr), start_sample, start_sample + expected_length, sr,
+                    normalize=False, dtype=np.float32,
+                    out=None if out_array is None else out_array[:expected_length])
+                windowed = True
+            elif synth == 'pretty_midi':
+                audio_signal = midi_data.synthesize(fs=sr)
+            else:
+                raise ValueError(f"unknown synth '{synth}', expected 'pretty_midi' or 'numpy'")
 
-        # 确保音频信号长度正确
-        expected_length = int(sr * duration)
-        if len(audio_signal) < expected_length:
-            # 如果音频信号太短，进行填充
-            audio_signal = np.pad(audio_signal, (0, expected_length - len(audio_signal)))
-        elif len(audio_signal) > expected_length:
-            # 如果音频信号太长，进行截断
-            audio_signal = audio_signal[:expected_length]
+        if not windowed:
+            # 其他合成器渲染的是完整文件，去掉 offset 之前的部分
+            if offset:
+                audio_signal = audio_signal[int(sr * offset):]
+            # 确保音频信号长度正确（填充或截断），同时转为 float32
+            audio_signal = _fit_length(audio_signal, expected_length, out_array)
+
+        # 原地归一化音频信号
+        if normalize:
+            _normalize(audio_signal)
 
-        # 归一化音频信号
-        if normalize and np.max(np.abs(audio_signal)) > 0:
-            audio_signal = audio_signal / np.max(np.abs(audio_signal))
+        if cache_key is not None:
+            cache.store(cache_key, audio_signal)
 
         # 保存音频文件（用于调试）
         if debug and save_audio:
@@ -97,6 +134,8 @@ def midi_to_audio_tensor(midi_path, sr=44100, duration=None, return_numpy=False,
         # 生成可视化图表（用于调试）
         if debug and visualize:
             try:
+                import librosa
+                import librosa.display
                 import matplotlib.pyplot as plt
 
                 # 创建波形图
@@ -131,7 +170,7 @@ def midi_to_audio_tensor(midi_path, sr=44100, duration=None, return_numpy=False,
         if return_numpy:
             return audio_signal, sr
         else:
-            return torch.from_numpy(audio_signal).float(), sr
+            return torch.from_numpy(audio_signal), sr
 
     except Exception as e:
         print(f"处理MIDI文件时出错: {e}")
@@ -140,6 +179,87 @@ def midi_to_audio_tensor(midi_path, sr=44100, duration=None, return_numpy=False,
         return None, sr
 
 
+def midi_to_audio_batch(midi_paths, fluid_pool, soundfont_path, sr=44100, duration=None, offset=0.,
+                        normalize=True, cache=None, return_numpy=False):
+    """
+    用 FluidSynth 进程池并行渲染一批 MIDI 文件，结果与逐个调用 midi_to_audio_tensor(soundfont_path=...) 相同
+
+    缓存命中的文件不再渲染，其余文件一次性交给 fluid_pool.render_batch，渲染结果写入缓存；
+    可用来为之后的 midi_to_audio_tensor 调用预先填充缓存。
+
+    返回:
+        list: 与 midi_paths 对应的 (audio, sr)，渲染失败时 audio 为 None
+    """
+    _check_pool(fluid_pool, soundfont_path, sr)
+    results = [None] * len(midi_paths)
+    keys = [None] * len(midi_paths)
+    misses = []
+    for idx, midi_path in enumerate(midi_paths):
+        if cache is not None:
+            keys[idx] = cache.key(midi_path, sr, soundfont_path, normalize, duration, 'pretty_midi', offset)
+            cached = cache.load(keys[idx], return_numpy=return_numpy)
+            if cached is not None:
+                results[idx] = (cached, sr)
+                continue
+        misses.append(idx)
+
+    # the cache key is the one midi_to_audio_tensor uses with its default synth argument
+    audios, end_times = fluid_pool.render_batch([midi_paths[idx] for idx in misses], return_end_times=True)
+    audio = None
+    for idx, audio, end_time in zip(misses, audios, end_times):
+        if audio is None:
+            results[idx] = (None, sr)
+            continue
+        length = int(sr * (duration if duration is not None else max(end_time - offset, 0.)))
+        # copied out of the shared memory, which is released below
+        audio_signal = _fit_length(audio[int(sr * offset):], length, np.empty(length, dtype=np.float32))
+        if normalize:
+            _normalize(audio_signal)
+        if keys[idx] is not None:
+            cache.store(keys[idx], audio_signal)
+        results[idx] = (audio_signal if return_numpy else torch.from_numpy(audio_signal), sr)
+    # drop the views into shared memory before releasing it
+    audios = audio = None
+    fluid_pool.release()
+    return results
+
+
+def _check_pool(fluid_pool, soundfont_path, sr):
+    if fluid_pool.soundfont_path != soundfont_path or fluid_pool.sr != sr:
+        raise ValueError(f"fluid_pool was started with {fluid_pool.soundfont_path} at {fluid_pool.sr} Hz")
+
+
+def _normalize(audio_signal):
+    if len(audio_signal):
+        peak = max(audio_signal.max(), -audio_signal.min())
+        if peak > 0:
+            audio_signal /= peak
+
+
+def _as_array(out):
+    out_array = out.numpy() if isinstance(out, torch.Tensor) else out
+    if out_array.dtype != np.float32 or out_array.ndim != 1:
+        raise ValueError(f"out must be a 1-d float32 buffer, got {out_array.dtype} with shape {out_array.shape}")
+    return out_array
+
+
+def _fit_length(audio_signal, length, out=None):
+    """
+    把音频填充或截断到 length，结果为 float32；已满足条件时不复制
+    """
+    if out is None:
+        if audio_signal.dtype == np.float32 and len(audio_signal) >= length:
+            return audio_signal[:length]
+        out = np.empty(length, dtype=np.float32)
+    elif len(out) < length:
+        raise ValueError(f"out holds {len(out)} samples, {length} are needed")
+    out = out[:length]
+    n = min(len(audio_signal), length)
+    out[:n] = audio_signal[:n]
+    out[n:] = 0
+    return out
+
+
 if __name__ == "__main__":
     file_name = "7iPSSj62CUw.mid"
     soundfont_path = "..\\asset\\GeneralUser-GS.sf2"
@@ -0,0 +1,285 @@
+import contextlib
+import inspect
+import math
+
+import numpy as np
+import pretty_midi
+import torch
+
+# ChromaStemConditioner settings of facebook/musicgen-melody(-large), used when no model is given
+CHROMA_SAMPLE_RATE = 32000
+CHROMA_WINDOW = 2 ** 14
+CHROMA_HOP = CHROMA_WINDOW // 4
+N_CHROMA = 12
+
+# librosa.filters.chroma weights each octave with a gaussian centred at octave 5 above A0
+_OCTAVE_CENTER = 5.
+_OCTAVE_WIDTH = 2.
+# points per analysis window used to integrate note energy
+_WINDOW_POINTS = 32
+
+
+def conditioner_params(model):
+    """
+    读取 MusicGen 旋律条件器的参数：(采样率, 窗长, 跳步, 是否 argmax)
+    """
+    conditioner = model.lm.condition_provider.conditioners['self_wav']
+    chroma = conditioner.chroma
+    return conditioner.sample_rate, chroma.winlen, chroma.winhop, chroma.argmax
+
+
+def midi_to_chroma(midi_data, duration, start=0., sample_rate=CHROMA_SAMPLE_RATE, window=CHROMA_WINDOW,
+                   hop=CHROMA_HOP, argmax=True):
+    """
+    直接由 MIDI 音符计算旋律条件用的色度图，不经过音频合成和 STFT
+
+    每个音符对每一帧的贡献为 力度^2 * 汉宁窗内 exp(-2t) 包络能量 * librosa 八度权重，
+    近似 midi_synth 合成的正弦音频经 ChromaExtractor 得到的能量（忽略频谱泄漏）。
+
+    参数:
+        midi_data (pretty_midi.PrettyMIDI): 已解析的 MIDI
+        duration (float): 色度图覆盖的时长（秒）
+        start (float): 起始时间（秒）
+        sample_rate, window, hop: 条件器的 STFT 参数，帧率为 sample_rate / hop
+        argmax (bool): 是否像条件器一样只保留每帧最强的音级（one-hot）
+
+    返回:
+        np.ndarray: 形状为 (frames, 12) 的 float32 色度图
+    """
+    # same frame count as a center=True spectrogram over the resampled audio
+    n_frames = 1 + int(duration * sample_rate) // hop
+    frame_time = hop / sample_rate
+    half_window = window / 2 / sample_rate
+
+    starts, ends, pitches, velocities = [], [], [], []
+    for instrument in midi_data.instruments:
+        if instrument.is_drum:
+            continue
+        for note in instrument.notes:
+            starts.append(note.start)
+            ends.append(note.end)
+            pitches.append(note.pitch)
+            velocities.append(note.velocity)
+    note_start = np.asarray(starts, dtype=np.float64) - start
+    note_end = np.asarray(ends, dtype=np.float64) - start
+    pitch = np.asarray(pitches, dtype=np.int64)
+    velocity = np.asarray(velocities, dtype=np.float64)
+
+    # frames whose analysis window overlaps each note
+    first = np.clip(np.floor((note_start - half_window) / frame_time), 0, n_frames).astype(np.int64)
+    last = np.clip(np.ceil((note_end + half_window) / frame_time) + 1, 0, n_frames).astype(np.int64)
+    count = np.maximum(last - first, 0)
+    note_idx = np.repeat(np.arange(len(count)), count)
+    frame = np.repeat(first - np.cumsum(count) + count, count) + np.arange(count.sum())
+
+    # energy of the exp(-t) envelope seen through the squared hann window, sampled at _WINDOW_POINTS points
+    u = (np.arange(_WINDOW_POINTS) + .5) / _WINDOW_POINTS
+    hann = np.sin(np.pi * u) ** 4
+    t = frame[:, None] * frame_time + (u - .5) * 2 * half_window
+    since_onset = t - note_start[note_idx, None]
+    inside = (since_onset >= 0) & (t < note_end[note_idx, None])
+    energy = (hann * np.exp(-2 * np.maximum(since_onset, 0)) * inside).sum(axis=1)
+
+    octave = np.log2(pretty_midi.note_number_to_hz(np.arange(128)) / 27.5)
+    octave_weight = np.exp(-.5 * ((octave - _OCTAVE_CENTER) / _OCTAVE_WIDTH) ** 2)
+    weights = energy * velocity[note_idx] ** 2 * octave_weight[pitch[note_idx]]
+
+    chroma = np.bincount(frame * N_CHROMA + pitch[note_idx] % N_CHROMA, weights=weights,
+                         minlength=n_frames * N_CHROMA).reshape(n_frames, N_CHROMA)
+    # inf-norm per frame like ChromaExtractor
+    chroma /= np.maximum(chroma.max(axis=1, keepdims=True), 1e-6)
+    if argmax:
+        # silent frames also become pitch class 0, as in the audio path
+        one_hot = np.zeros_like(chroma)
+        one_hot[np.arange(n_frames), chroma.argmax(axis=1)] = 1
+        chroma = one_hot
+    return chroma.astype(np.float32)
+
+
+def model_chroma(model, midi_data, duration, start=0.):
+    """
+    按模型条件器的帧率计算色度图
+    """
+    sample_rate, window, hop, argmax = conditioner_params(model)
+    return midi_to_chroma(midi_data, duration, start=start, sample_rate=sample_rate, window=window, hop=hop,
+                          argmax=argmax)
+
+
+def melody_chroma(model, melody, sr):
+    """
+    由音频旋律计算条件色度图，与 MusicGen.generate_with_chroma 内部的计算相同（含分轨）
+
+    参数:
+        melody (torch.Tensor): 形状为 (channels, samples) 的音频
+        sr (int): melody 的采样率
+
+    返回:
+        np.ndarray: 形状为 (frames, 12) 的 float32 色度图，可直接传给 generate_with_midi_chroma
+    """
+    from audiocraft.data.audio_utils import convert_audio
+    from audiocraft.modules.conditioners import WavCondition
+
+    conditioner = model.lm.condition_provider.conditioners['self_wav']
+    wav = convert_audio(torch.as_tensor(melody), sr, model.sample_rate, model.audio_channels).to(model.device)
+    condition = WavCondition(wav[None], torch.tensor([wav.shape[-1]], device=model.device),
+                             sample_rate=[model.sample_rate], path=[None], seek_time=[None])
+    # the full length is kept, chroma_passthrough matches it to the conditioner length when it is used
+    match_len_on_eval = getattr(conditioner, 'match_len_on_eval', False)
+    conditioner.match_len_on_eval = False
+    try:
+        with torch.no_grad():
+            chroma = conditioner._get_wav_embedding(condition)
+    finally:
+        conditioner.match_len_on_eval = match_len_on_eval
+    return chroma[0].float().cpu().numpy()
+
+
+def check_conditioner(conditioner):
+    """
+    确认已安装的 audiocraft 中旋律条件器仍是 chroma_passthrough 所替换的实现（按 audiocraft 1.3.0 编写）：
+    ChromaStemConditioner 在 forward 中调用 _get_wav_embedding(x)，并带有下面读取的属性；不符合时抛出 RuntimeError
+    """
+    import audiocraft
+    from audiocraft.modules.conditioners import ChromaStemConditioner, WaveformConditioner
+
+    problems = []
+    if not isinstance(conditioner, ChromaStemConditioner):
+        problems.append(f'self_wav is a {type(conditioner).__name__}, not a ChromaStemConditioner')
+    method = getattr(type(conditioner), '_get_wav_embedding', None)
+    if method is None or list(inspect.signature(method).parameters) != ['self', 'x']:
+        problems.append('_get_wav_embedding(self, x) not found')
+    elif '_get_wav_embedding' not in inspect.getsource(WaveformConditioner.forward):
+        problems.append('WaveformConditioner.forward no longer calls _get_wav_embedding')
+    if '_get_wav_embedding' in vars(conditioner):
+        problems.append('_get_wav_embedding is already patched on this instance')
+    for name in ('sample_rate', 'match_len_on_eval', 'chroma_len'):
+        if not hasattr(conditioner, name):
+            problems.append(f'missing attribute {name}')
+    for name in ('argmax', 'winlen', 'winhop'):
+        if not hasattr(getattr(conditioner, 'chroma', None), name):
+            problems.append(f'missing attribute chroma.{name}')
+    if problems:
+        raise RuntimeError(f'chroma_passthrough does not match audiocraft {audiocraft.__version__}: '
+                           + '; '.join(problems))
+
+
+@contextlib.contextmanager
+def chroma_passthrough(model):
+    """
+    在上下文内让旋律条件器直接使用传入的色度图，而不是从波形计算
+
+    色度图以展平的形式放在 WavCondition.wav 中；无条件分支（CFG 的空条件）与真实条件一起送入时，
+    其各帧按静音处理（argmax 时为音级 0），只有空条件时仍走原来的路径。
+    """
+    conditioner = model.lm.condition_provider.conditioners['self_wav']
+    check_conditioner(conditioner)
+    original = conditioner._get_wav_embedding
+
+    def embedding(x):
+        wav = x.wav
+        if wav.shape[-1] < N_CHROMA or wav.shape[-1] % N_CHROMA:
+            return original(x)
+        chroma = wav.reshape(wav.shape[0], -1, N_CHROMA).clone()
+        # nullified rows (classifier-free guidance) are silent at full length, their mask hides them anyway
+        chroma[x.length == 0] = 0
+        if conditioner.chroma.argmax:
+            # frames padded by collation are silent, which the extractor maps to pitch class 0
+            chroma[..., 0][chroma.sum(-1) == 0] = 1
+        chroma_len = getattr(conditioner, 'chroma_len', None)
+        if getattr(conditioner, 'match_len_on_eval', False) and chroma_len:
+            if chroma.shape[1] < chroma_len:
+                chroma = chroma.repeat(1, int(math.ceil(chroma_len / chroma.shape[1])), 1)
+            chroma = chroma[:, :chroma_len]
+        return chroma
+
+    conditioner._get_wav_embedding = embedding
+    try:
+        yield
+    finally:
+        del conditioner._get_wav_embedding
+
+
+def _chroma_condition(chroma, sample_rate, hop, device):
+    from audiocraft.modules.conditioners import WavCondition
+
+    chroma = torch.as_tensor(chroma, dtype=torch.float32, device=device)
+    return WavCondition(
+        chroma.reshape(1, 1, -1),
+        # lengths are in samples, the conditioner divides by the hop to mask frames
+        torch.tensor([chroma.shape[0] * hop], device=device),
+        sample_rate=[sample_rate],
+        path=[None],
+        seek_time=[None])
+
+
+def _extend_tokens(model, attributes, chromas, prompt_tokens, progress):
+    """
+    生成时长超过 model.max_duration 时的分窗续写，与 MusicGen._generate_tokens 的 extend 分支相同，
+    只是每个窗口的旋律条件按色度帧（而不是音频采样点）从整首的色度图中循环取出
+    """
+    sample_rate, _, hop, _ = conditioner_params(model)
+    total_gen_len = int(model.duration * model.frame_rate)
+    stride_tokens = int(model.frame_rate * model.extend_stride)
+    # frames the extractor gives for max_duration seconds of audio
+    window_frames = 1 + int(model.max_duration * sample_rate) // hop
+    chromas = [torch.as_tensor(chroma, dtype=torch.float32, device=model.device) for chroma in chromas]
+    if prompt_tokens is not None and prompt_tokens.shape[-1] > int(model.max_duration * model.frame_rate):
+        raise ValueError('prompt is longer than one generation window')
+
+    all_tokens = [] if prompt_tokens is None else [prompt_tokens]
+    prompt_length = 0 if prompt_tokens is None else prompt_tokens.shape[-1]
+    current_gen_offset = 0
+    callback = None
+    if progress:
+        def callback(generated_tokens, tokens_to_generate):
+            print(f'{generated_tokens + current_gen_offset: 6d} / {tokens_to_generate: 6d}', end='\r')
+
+    while current_gen_offset + prompt_length < total_gen_len:
+        time_offset = current_gen_offset / model.frame_rate
+        chunk_duration = min(model.duration - time_offset, model.max_duration)
+        first = int(round(time_offset * sample_rate / hop))
+        for attr, chroma in zip(attributes, chromas):
+            # a melody shorter than the generation is repeated, as the audio path does
+            positions = torch.arange(first, first + window_frames, device=model.device) % len(chroma)
+            attr.wav['self_wav'] = _chroma_condition(chroma[positions], sample_rate, hop, model.device)
+        with model.autocast:
+            gen_tokens = model.lm.generate(prompt_tokens, attributes, callback=callback,
+                                           max_gen_len=int(chunk_duration * model.frame_rate),
+                                           **model.generation_params)
+        all_tokens.append(gen_tokens if prompt_tokens is None else gen_tokens[:, :, prompt_tokens.shape[-1]:])
+        prompt_tokens = gen_tokens[:, :, stride_tokens:]
+        prompt_length = prompt_tokens.shape[-1]
+        current_gen_offset += stride_tokens
+    return torch.cat(all_tokens, dim=-1)
+
+
+def generate_with_midi_chroma(model, descriptions, chromas, progress=False, return_tokens=False,
+                              prompt_tokens=None):
+    """
+    与 MusicGen.generate_with_chroma 相同，但旋律条件直接使用 midi_to_chroma 的结果
+
+    生成时长超过 model.max_duration（30 秒）时与 audiocraft 一样以 extend_stride 分窗续写，
+    每个窗口取对应时间段的色度帧。
+
+    参数:
+        model (MusicGen): 旋律模型
+        descriptions (list): 文本提示
+        chromas (list): 与 descriptions 对应的 (frames, 12) 色度图
+        prompt_tokens (torch.Tensor): 形状为 [B, K, T] 的续写前缀 token，生成结果包含这部分
+    """
+    if len(chromas) != len(descriptions):
+        raise ValueError(f"got {len(chromas)} chromas for {len(descriptions)} descriptions")
+    sample_rate, _, hop, _ = conditioner_params(model)
+    attributes, _ = model._prepare_tokens_and_attributes(descriptions, None)
+
+    with chroma_passthrough(model):
+        if model.duration > model.max_duration:
+            # MusicGen's own extend branch indexes the condition in audio samples, which a flat chroma is not
+            tokens = _extend_tokens(model, attributes, chromas, prompt_tokens, progress)
+        else:
+            for attr, chroma in zip(attributes, chromas):
+                attr.wav['self_wav'] = _chroma_condition(chroma, sample_rate, hop, model.device)
+            tokens = model._generate_tokens(attributes, prompt_tokens, progress)
+    if return_tokens:
+        return model.generate_audio(tokens), tokens
+    return model.generate_audio(tokens)
@@ -0,0 +1,81 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pretty_midi
+
+INDEX_COLUMNS = ['end_time', 'note_count', 'programs', 'pitch_min', 'pitch_max', 'onset_density']
+
+
+def midi_metadata(midi_path):
+    """
+    解析一个 MIDI 文件并提取索引所需的元数据，解析失败时返回 None
+    """
+    try:
+        midi_data = pretty_midi.PrettyMIDI(midi_path)
+    except Exception as e:
+        print(f'unable to index {midi_path}: {e}')
+        return None
+    pitches = np.array([note.pitch for instrument in midi_data.instruments for note in instrument.notes])
+    end_time = midi_data.get_end_time()
+    stat = os.stat(midi_path)
+    return {
+        'midi_path': midi_path,
+        'end_time': end_time,
+        'note_count': len(pitches),
+        'programs': sorted({instrument.program for instrument in midi_data.instruments}),
+        'pitch_min': int(pitches.min()) if len(pitches) else -1,
+        'pitch_max': int(pitches.max()) if len(pitches) else -1,
+        # notes per second
+        'onset_density': len(pitches) / end_time if end_time > 0 else 0.,
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+    }
+
+
+def load_midi_index(index_path):
+    if not os.path.exists(index_path):
+        return None
+    return pd.read_parquet(index_path).set_index('midi_path', drop=False)
+
+
+def build_midi_index(midi_paths, index_path=None, workers=None):
+    """
+    为一组 MIDI 文件建立列式元数据索引，并行解析，只处理新增或修改过的文件
+
+    参数:
+        midi_paths (list): MIDI 文件路径
+        index_path (str): 索引文件（parquet）路径，为 None 时不读取也不保存
+        workers (int): 解析进程数，默认为 CPU 核数
+
+    返回:
+        pandas.DataFrame: 以 midi_path 为索引，包含 INDEX_COLUMNS 各列
+    """
+    midi_paths = list(dict.fromkeys(p for p in midi_paths if p))
+    index = load_midi_index(index_path) if index_path else None
+
+    stale = midi_paths
+    if index is not None:
+        known = index.reindex(midi_paths)
+        stats = [os.stat(p) for p in midi_paths]
+        changed = (known['mtime'].to_numpy() != [s.st_mtime for s in stats]) | \
+                  (known['size'].to_numpy() != [s.st_size for s in stats])
+        stale = [p for p, c in zip(midi_paths, changed) if c]
+
+    rows = []
+    if stale:
+        print(f'indexing {len(stale)} midi files...')
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            rows = [row for row in executor.map(midi_metadata, stale, chunksize=16) if row is not None]
+
+    fresh = pd.DataFrame(rows, columns=['midi_path'] + INDEX_COLUMNS + ['mtime', 'size'])
+    if index is not None:
+        index = pd.concat([index[~index['midi_path'].isin(fresh['midi_path'])], fresh], ignore_index=True)
+    else:
+        index = fresh
+    index = index.set_index('midi_path', drop=False)
+
+    if index_path and rows:
+        index.to_parquet(index_path, index=False)
+    return index.reindex([p for p in midi_paths if p in index.index])
@@ -0,0 +1,220 @@
+import numpy as np
+import pretty_midi
+
+# exp(-t) envelope is below 1e-7 after this many seconds, longer notes are cut here
+MAX_NOTE_SECONDS = 16.0
+# length of the linear fade at the end of every note, same as pretty_midi
+FADE_SECONDS = .1
+
+
+def collect_notes(midi_data, fs):
+    """
+    把所有非鼓乐器的音符展平成数组 (start, length, pitch, velocity)，单位为采样点，按起始时间排序
+    """
+    starts, ends, pitches, velocities = [], [], [], []
+    for instrument in midi_data.instruments:
+        if instrument.is_drum:
+            continue
+        for note in instrument.notes:
+            starts.append(note.start)
+            ends.append(note.end)
+            pitches.append(note.pitch)
+            velocities.append(note.velocity)
+
+    # same rounding as pretty_midi.Instrument.synthesize
+    start = (np.asarray(starts, dtype=np.float64) * fs).astype(np.int64)
+    end = (np.asarray(ends, dtype=np.float64) * fs).astype(np.int64)
+    length = end - start
+    keep = length > 0
+    order = np.argsort(start[keep], kind='stable')
+    return (start[keep][order], length[keep][order],
+            np.asarray(pitches, dtype=np.int64)[keep][order],
+            np.asarray(velocities, dtype=np.float64)[keep][order])
+
+
+def pitch_wavetables(pitch, length, fs, dtype=np.float64):
+    """
+    为每个用到的音高预先计算 sin(2*pi*f*t) * exp(-t)，长度为该音高最长的音符
+
+    返回:
+        dict: pitch -> np.ndarray
+    """
+    length = np.minimum(length, int(MAX_NOTE_SECONDS * fs))
+    if len(length) == 0:
+        return {}
+    longest = np.zeros(128, dtype=np.int64)
+    np.maximum.at(longest, pitch, length)
+
+    n = np.arange(longest.max())
+    decay = np.exp(-n / fs)
+    frequencies = pretty_midi.note_number_to_hz(np.arange(128))
+    tables = {}
+    for p in np.flatnonzero(longest):
+        size = longest[p]
+        tables[p] = (np.sin(2 * np.pi * frequencies[p] / fs * n[:size]) * decay[:size]).astype(dtype, copy=False)
+    return tables
+
+
+def render_notes(out, start, length, pitch, velocity, fs, tables=None, offset=0):
+    """
+    把一组音符叠加进 out，out[0] 对应第 offset 个采样点，窗口外的部分不渲染
+
+    与 pretty_midi 一致: 正弦波 * exp(-t) 衰减包络 * 末尾 0.1 秒线性淡出 * 力度，忽略弯音。
+    波形来自 pitch_wavetables，每个音符只剩一次切片累加。
+    """
+    if tables is None:
+        tables = pitch_wavetables(pitch, length, fs, dtype=out.dtype)
+    fade = int(FADE_SECONDS * fs)
+    fade_out = np.linspace(1, 0, fade).astype(out.dtype, copy=False)
+    limit = int(MAX_NOTE_SECONDS * fs)
+    window = len(out)
+
+    for s, size, p, v in zip(start.tolist(), length.tolist(), pitch.tolist(), velocity.tolist()):
+        table = tables[p]
+        if size > limit:
+            # the fade would land where the envelope is already silent
+            size, body, ramp = limit, limit, None
+        elif size > fade:
+            body, ramp = size - fade, fade_out
+        else:
+            body, ramp = 0, np.linspace(1, 0, size)
+
+        # visible part of the note, in samples from its onset
+        first = max(offset - s, 0)
+        last = min(size, offset + window - s)
+        if first >= last:
+            continue
+        o = s - offset
+        if first < body:
+            stop = min(last, body)
+            out[o + first:o + stop] += v * table[first:stop]
+        if last > body:
+            begin = max(first, body)
+            out[o + begin:o + last] += v * table[begin:last] * ramp[begin - body:last - body]
+    return out
+
+
+def active_notes(notes, fs, start_sample, end_sample):
+    """
+    选出在 [start_sample, end_sample) 内发声的音符
+    """
+    start, length, pitch, velocity = notes
+    audible = np.minimum(length, int(MAX_NOTE_SECONDS * fs))
+    mask = (start < end_sample) & (start + audible > start_sample)
+    return start[mask], length[mask], pitch[mask], velocity[mask]
+
+
+def render_window(midi_data, start, end, fs=44100, normalize=True, dtype=np.float64, notes=None, tables=None):
+    """
+    只渲染 [start, end) 秒之间的音频，只处理在该窗口内发声的音符
+
+    参数:
+        midi_data (pretty_midi.PrettyMIDI): 已解析的 MIDI
+        start (float): 起始时间（秒）
+        end (float): 结束时间（秒）
+        fs (int): 采样率
+        normalize (bool): 是否按窗口内的峰值归一化到 [-1, 1]
+        dtype: 输出数组类型
+        notes: collect_notes 的结果，多次调用时可复用
+        tables: pitch_wavetables 的结果，多次调用时可复用
+
+    返回:
+        np.ndarray: 长度为 int(end * fs) - int(start * fs) 的音频信号，与完整渲染后切片的结果相同
+    """
+    if notes is None:
+        notes = collect_notes(midi_data, fs)
+    return render_samples(notes, int(start * fs), int(end * fs), fs, normalize=normalize, dtype=dtype, tables=tables)
+
+
+def render_samples(notes, start_sample, end_sample, fs, normalize=True, dtype=np.float64, tables=None, out=None):
+    """
+    按采样点渲染 [start_sample, end_sample)，给定 out 时直接写入（覆盖）out
+    """
+    if out is None:
+        window = np.zeros(max(end_sample - start_sample, 0), dtype=dtype)
+    else:
+        if len(out) != end_sample - start_sample:
+            raise ValueError(f"out holds {len(out)} samples, {end_sample - start_sample} are needed")
+        window = out
+        window[:] = 0
+    render_notes(window, *active_notes(notes, fs, start_sample, end_sample), fs=fs, tables=tables,
+                 offset=start_sample)
+
+    peak = max(window.max(), -window.min()) if len(window) else 0
+    if normalize and peak > 0:
+        window /= peak
+    return window
+
+
+def synthesized_length(midi_data, fs):
+    """
+    PrettyMIDI.synthesize 输出的采样点数（每个乐器结束后多留 1 秒）
+    """
+    if len(midi_data.instruments) == 0:
+        return 0
+    return max(int(fs * (instrument.get_end_time() + 1)) for instrument in midi_data.instruments)
+
+
+def peak_amplitude(notes, fs, end_sample, chunk_samples, dtype=np.float64, tables=None):
+    """
+    逐块渲染 [0, end_sample) 求绝对值峰值，只占用一个块的内存
+    """
+    peak = 0.
+    buffer = np.empty(chunk_samples, dtype=dtype)
+    for chunk_start in range(0, end_sample, chunk_samples):
+        chunk_end = min(chunk_start + chunk_samples, end_sample)
+        window = render_samples(notes, chunk_start, chunk_end, fs, normalize=False, dtype=dtype, tables=tables,
+                                out=buffer[:chunk_end - chunk_start])
+        peak = max(peak, window.max(), -window.min())
+    return peak
+
+
+def iter_chunks(midi_data, chunk_seconds, fs=44100, start=0., end=None, normalize=True, dtype=np.float64,
+                peak=None):
+    """
+    逐块渲染 [start, end) 区间，每次产出 chunk_seconds 秒的音频，峰值内存只与块大小有关
+
+    end 默认为 MIDI 的结束时间，最后一块可能更短。normalize 时所有块按整首的峰值归一化，
+    拼接结果与 synthesize() 切片相同；未给出 peak 时先逐块渲染一遍整首求峰值（渲染时间约翻倍）。
+    """
+    if end is None:
+        end = midi_data.get_end_time()
+    notes = collect_notes(midi_data, fs)
+    tables = pitch_wavetables(notes[2], notes[1], fs, dtype=dtype)
+    chunk_samples = int(chunk_seconds * fs)
+    if normalize and peak is None:
+        peak = peak_amplitude(notes, fs, synthesized_length(midi_data, fs), chunk_samples, dtype=dtype,
+                              tables=tables)
+    start_sample, end_sample = int(start * fs), int(end * fs)
+    for chunk_start in range(start_sample, end_sample, chunk_samples):
+        chunk_end = min(chunk_start + chunk_samples, end_sample)
+        chunk = render_samples(notes, chunk_start, chunk_end, fs, normalize=False, dtype=dtype, tables=tables)
+        if normalize and peak > 0:
+            chunk /= peak
+        yield chunk
+
+
+def synthesize(midi_data, fs=44100, normalize=True, dtype=np.float64):
+    """
+    批量版本的 PrettyMIDI.synthesize，所有乐器的音符共用一组预计算波表
+
+    参数:
+        midi_data (pretty_midi.PrettyMIDI): 已解析的 MIDI
+        fs (int): 采样率
+        normalize (bool): 是否归一化到 [-1, 1]
+        dtype: 输出数组类型
+
+    返回:
+        np.ndarray: 长度与 PrettyMIDI.synthesize 相同的音频信号
+    """
+    if len(midi_data.instruments) == 0:
+        return np.array([], dtype=dtype)
+
+    total = synthesized_length(midi_data, fs)
+    synthesized = np.zeros(total, dtype=dtype)
+    render_notes(synthesized, *collect_notes(midi_data, fs), fs=fs)
+
+    peak = max(synthesized.max(), -synthesized.min()) if total else 0
+    if normalize and peak > 0:
+        synthesized /= peak
+    return synthesized
@@ -0,0 +1,178 @@
+import glob
+import json
+import os
+import random
+import re
+import threading
+import time
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+# {file_name}_part{idx}_{style}.wav or {file_name}_{style}.wav, styles never contain '_'
+_PART = re.compile(r'^(?P<track>.+)_part(?P<part>\d+)$')
+
+_manifests = {}
+_lock = threading.Lock()
+
+
+def parse_output_name(name):
+    """
+    由输出文件名解析 (track, style, part)，不是生成结果时返回 None
+    """
+    stem, ext = os.path.splitext(name)
+    if ext != '.wav' or '_' not in stem:
+        return None
+    rest, style = stem.rsplit('_', 1)
+    match = _PART.match(rest)
+    if match:
+        return match['track'], style, int(match['part'])
+    return rest, style, None
+
+
+class OutputManifest:
+    """
+    已生成输出的清单：每写完一个 WAV 追加一行 JSON，查询都在内存中完成
+
+    替代对输出目录的 os.listdir + 子串匹配。追加写入并 fsync，进程中断后最多丢失正在写的那一行，
+    重新打开即可从中断处继续；清单不存在时由目录中已有的 WAV 建立一次。
+
+    多个进程（data.shard_runner 的 worker）各自写 manifest.<name>.jsonl，打开时会读入同目录下所有清单。
+    写线程（AudioWriterPool 的 on_done）在锁内更新索引，查询也持有同一把锁。
+    """
+
+    def __init__(self, output_path, manifest_path=None):
+        self.output_path = output_path
+        self.manifest_path = manifest_path or os.path.join(output_path, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        # track -> style -> [done parts, expected parts or None]
+        self._done = {}
+        checkpoints = glob.glob(os.path.join(glob.escape(os.path.dirname(self.manifest_path)), 'manifest*.jsonl'))
+        if checkpoints:
+            for path in checkpoints:
+                self._load(path)
+        else:
+            self._bootstrap()
+        self._file = open(self.manifest_path, 'a', encoding='utf-8')
+        if self._torn_tail():
+            # terminate the interrupted line so the next entry starts on its own
+            self._file.write('\n')
+            self._file.flush()
+
+    def _torn_tail(self):
+        with open(self.manifest_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b'\n'
+
+    def _load(self, path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # the line being written when a run was interrupted
+                    continue
+                self._add(entry['track'], entry['style'], entry.get('part'), entry.get('parts'))
+
+    def _bootstrap(self):
+        entries = []
+        if os.path.isdir(self.output_path):
+            for name in os.listdir(self.output_path):
+                parsed = parse_output_name(name)
+                if parsed is not None:
+                    entries.append(dict(zip(('track', 'style', 'part'), parsed)))
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                # the expected part count of earlier runs is unknown, they count as complete
+                entry['parts'] = None
+                self._add(entry['track'], entry['style'], entry['part'], None)
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        if entries:
+            print(f'manifest: indexed {len(entries)} existing outputs in {self.output_path}')
+
+    def _add(self, track, style, part, parts):
+        state = self._done.setdefault(track, {}).setdefault(style, [set(), parts])
+        state[0].add(part)
+        if parts is not None:
+            state[1] = parts
+
+    def record(self, track, style, part=None, parts=None):
+        """
+        记录一个已经写到磁盘的输出
+
+        参数:
+            part (int): split_audio 时的片段序号
+            parts (int): 这一次生成共有多少个片段，用来判断是否全部完成
+        """
+        entry = {'track': track, 'style': style, 'part': part, 'parts': parts, 'time': time.time()}
+        with self._lock:
+            self._add(track, style, part, parts)
+            self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def _complete(self, state):
+        done, parts = state
+        return parts is None or len(done) >= parts
+
+    def is_done(self, track, style=None, part=None):
+        """
+        style 为 None 时判断该曲目是否有任何输出；给出 part 时判断单个片段
+        """
+        with self._lock:
+            styles = self._done.get(track)
+            if not styles:
+                return False
+            if style is None:
+                return True
+            state = styles.get(style)
+            if state is None:
+                return False
+            return part in state[0] if part is not None else self._complete(state)
+
+    def runs(self, track):
+        """
+        该曲目已完成的生成次数（每次一种风格）
+        """
+        with self._lock:
+            return sum(self._complete(state) for state in self._done.get(track, {}).values())
+
+    def incomplete(self, track):
+        """
+        中断的生成：返回 (style, 已完成的片段集合)，没有时返回 None
+        """
+        with self._lock:
+            for style, state in self._done.get(track, {}).items():
+                if not self._complete(state):
+                    return style, set(state[0])
+        return None
+
+    def unused_style(self, track, styles, fix_style=None):
+        if fix_style:
+            return fix_style
+        with self._lock:
+            used = set(self._done.get(track, {}))
+        candidates = [s for s in styles if s not in used]
+        # every style has been used: fall back to any, as the random retry loop would never end
+        return random.choice(candidates or styles)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(state[0]) for styles in self._done.values() for state in styles.values())
+
+
+def output_manifest(output_path):
+    """
+    每个输出目录在进程内共用一个清单
+    """
+    key = os.path.abspath(output_path)
+    with _lock:
+        if key not in _manifests:
+            _manifests[key] = OutputManifest(output_path)
+        return _manifests[key]
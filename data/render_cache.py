@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+class RenderCache:
+    """
+    MIDI 渲染结果的磁盘缓存，按 MIDI 文件内容哈希 + 渲染参数寻址
+
+    每个条目是一个 float32 的 .npy 文件，命中时以内存映射方式读取，
+    超过 max_bytes 时按最近使用时间 (LRU) 删除最旧的条目。
+    """
+
+    def __init__(self, cache_dir="./cache/render/", max_bytes=20 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, midi_path, sr, soundfont_path=None, normalize=True, duration=None, synth='pretty_midi', offset=0.):
+        with open(midi_path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        params = json.dumps([sr, soundfont_path, normalize, duration, synth, offset])
+        return f'{digest}-{hashlib.sha1(params.encode()).hexdigest()[:16]}'
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.npy')
+
+    def load(self, key, return_numpy=True):
+        """
+        读取缓存条目，未命中返回 None
+
+        返回的 numpy 数组是写时复制的内存映射，torch 张量与其共享内存
+        """
+        path = self.path(key)
+        try:
+            audio = np.load(path, mmap_mode='c')
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        # mtime doubles as the LRU timestamp
+        os.utime(path)
+        if return_numpy:
+            return audio
+        import torch
+        return torch.from_numpy(audio)
+
+    def store(self, key, audio):
+        path = self.path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(audio, dtype=np.float32))
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npy'):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.,
+        }
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# seconds a cached response stays valid per namespace, None never expires;
+# search rankings drift, view counts drift faster, a model's answer to the same prompt is kept
+DEFAULT_TTL = {
+    'search': 7 * 24 * 3600,
+    'videos': 24 * 3600,
+    'gemini': None,
+}
+
+
+class OfflineCacheMiss(KeyError):
+    """
+    离线回放模式下请求不在缓存中
+    """
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return ' '.join(value.split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+class ResponseCache:
+    """
+    API 请求/响应的持久缓存（SQLite），YouTube Data API 和 Gemini 共用
+
+    键为 命名空间 + 规范化后的请求参数（去掉 None，压缩空白，键排序）的哈希，值为 JSON 响应。
+    offline=True 时只读缓存，未命中抛出 OfflineCacheMiss 而不是发出请求，用于离线回放和测试。
+    每个线程使用自己的连接，数据库为 WAL 模式，可被多个线程和进程同时读写。
+    """
+
+    def __init__(self, path='./cache/responses.sqlite', ttl=None, offline=False):
+        """
+        参数:
+            ttl (dict): 覆盖 DEFAULT_TTL 中各命名空间的有效期（秒）
+            offline (bool): 离线回放模式
+        """
+        self.path = path
+        self.ttl = {**DEFAULT_TTL, **(ttl or {})}
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, namespace TEXT, '
+                         'request TEXT, response TEXT, created REAL)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key(namespace, request):
+        request = json.dumps(_normalize(request), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(f'{namespace}\n{request}'.encode()).hexdigest(), request
+
+    def get(self, namespace, request):
+        """
+        返回缓存的响应，未命中或已过期返回 None
+        """
+        key, _ = self.key(namespace, request)
+        row = self._connection().execute('SELECT response, created FROM responses WHERE key = ?', (key,)).fetchone()
+        ttl = self.ttl.get(namespace)
+        # an offline replay serves whatever was recorded, expired or not
+        if row is None or (ttl is not None and not self.offline and time.time() - row[1] > ttl):
+            return None
+        return json.loads(row[0])
+
+    def put(self, namespace, request, response):
+        key, request = self.key(namespace, request)
+        with self._connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                         (key, namespace, request, json.dumps(response, ensure_ascii=False), time.time()))
+
+    def fetch(self, namespace, request, fn):
+        """
+        命中时返回缓存的响应，否则调用 fn() 并缓存其结果（须可 JSON 序列化）；异常不会被缓存
+        """
+        response = self.get(namespace, request)
+        with self._lock:
+            if response is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if response is not None:
+            return response
+        if self.offline:
+            raise OfflineCacheMiss(f'{namespace} request not in {self.path}: {self.key(namespace, request)[1]}')
+        response = fn()
+        self.put(namespace, request, response)
+        return response
+
+    def clear(self, namespace=None):
+        with self._connection() as conn:
+            if namespace is None:
+                conn.execute('DELETE FROM responses')
+            else:
+                conn.execute('DELETE FROM responses WHERE namespace = ?', (namespace,))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,154 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import time
+
+from data.output_manifest import OutputManifest
+
+
+def parse_shard(shard):
+    """
+    解析 'i/N'（0 <= i < N）
+    """
+    index, count = (int(x) for x in shard.split('/'))
+    if not 0 <= index < count:
+        raise ValueError(f'shard {shard} is not of the form i/N with 0 <= i < N')
+    return index, count
+
+
+def shard_of(source_path, num_shards):
+    """
+    按文件名哈希分片：与数据集顺序和机器无关，同一文件总在同一分片
+    """
+    name = os.path.basename(source_path)
+    return int(hashlib.sha1(name.encode('utf-8')).hexdigest(), 16) % num_shards
+
+
+def shard_items(items, shard=0, num_shards=1):
+    """
+    items 为 (source_path, tag, end_time) 列表，返回属于该分片的部分
+    """
+    return [item for item in items if shard_of(item[0], num_shards) == shard]
+
+
+def _worker(worker_name, threads, output_path, token_dir, scheduler_kwargs, tasks, events):
+    import torch
+
+    from data.audio_writer import AudioWriterPool
+    from data.batch_scheduler import BatchScheduler
+    from data.token_store import TokenStore
+    from utils.models import MELODY_MODEL, get_model
+
+    # per-worker checkpoint, every worker still sees what the others have written when it starts
+    manifest = OutputManifest(output_path, os.path.join(output_path, f'manifest.{worker_name}.jsonl'))
+    token_store = TokenStore(token_dir, writer=worker_name) if token_dir else None
+    model = get_model(MELODY_MODEL)
+    # the cores are split between the workers instead of every worker using all of them, this overrides the
+    # thread count of the inference profile
+    torch.set_num_threads(threads)
+
+    def on_done(source_path, seconds, error):
+        # reported by the scheduler once every segment of the file has been generated, or its batch failed
+        events.put(('item', worker_name, source_path, seconds, error))
+
+    scheduler = None
+    try:
+        with AudioWriterPool() as writer:
+            with BatchScheduler(model, output_path, writer=writer, manifest=manifest, token_store=token_store,
+                                on_done=on_done, **scheduler_kwargs) as scheduler:
+                while True:
+                    item = tasks.get()
+                    if item is None:
+                        break
+                    source_path, tag, end_time = item
+                    start = time.perf_counter()
+                    try:
+                        scheduler.add(source_path, tag, end_time=end_time)
+                    except Exception as e:
+                        # preparing the melody failed, nothing was queued
+                        on_done(source_path, time.perf_counter() - start, str(e))
+    finally:
+        # the runner waits for the stats of every worker
+        events.put(('stats', worker_name, scheduler.stats() if scheduler is not None else {}))
+        manifest.close()
+        if token_store is not None:
+            token_store.close()
+
+
+def run_sharded(items, output_path, shard=0, num_shards=1, workers=None, token_dir=None, **scheduler_kwargs):
+    """
+    多进程生成：本机处理 shard_items(items, shard, num_shards)，每个 worker 进程持有自己的模型
+
+    worker 从共享队列取任务，空闲的 worker 总是取下一首，长短不一的 MIDI 不会让某个进程空等；
+    队列按 end_time 从长到短排列，最长的曲目不会留到最后。已在输出清单中完成的曲目不再入队，
+    中断后用同样的参数重新运行即可继续。多台机器共享输出目录时各自指定不同的 shard。
+
+    参数:
+        items (list): (source_path, tag, end_time) 列表，end_time 可为 None
+        workers (int): worker 进程数，默认为 1；每个 worker 各自加载一份模型，按内存（显存）能放下的模型份数设置
+        token_dir (str): 保存 EnCodec token 的 TokenStore 目录，每个 worker 写自己的分块
+        scheduler_kwargs: 传给 data.batch_scheduler.BatchScheduler（batch_size、time_limit、split_audio、cache 等）
+
+    返回:
+        dict: 汇总的进度和各 worker 的 BatchScheduler.stats()
+    """
+    os.makedirs(output_path, exist_ok=True)
+    workers = workers or 1
+    threads = max(1, os.cpu_count() // workers)
+    manifest = OutputManifest(output_path, os.path.join(output_path, f'manifest.shard{shard}of{num_shards}.jsonl'))
+    todo = [item for item in shard_items(items, shard, num_shards)
+            if not manifest.runs(os.path.splitext(os.path.basename(item[0]))[0])]
+    manifest.close()
+    todo.sort(key=lambda item: -(item[2] or 0))
+    print(f'shard {shard}/{num_shards}: {len(todo)} files to generate with {workers} workers x {threads} threads')
+
+    # spawn: every worker initializes torch and loads its own model
+    context = multiprocessing.get_context('spawn')
+    tasks, events = context.Queue(), context.Queue()
+    for item in todo:
+        tasks.put(item)
+    processes = []
+    for idx in range(workers):
+        tasks.put(None)
+        process = context.Process(target=_worker, args=(f'shard{shard}of{num_shards}.w{idx}', threads, output_path,
+                                                        token_dir, scheduler_kwargs, tasks, events))
+        process.start()
+        processes.append(process)
+
+    start = time.perf_counter()
+    done, failed, stats = 0, 0, {}
+    while len(stats) < len(processes):
+        try:
+            event = events.get(timeout=10)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                print('all workers exited early')
+                break
+            continue
+        if event[0] == 'stats':
+            stats[event[1]] = event[2]
+            continue
+        _, worker_name, source_path, seconds, error = event
+        done += 1
+        if error:
+            failed += 1
+            print(f'{worker_name}: {source_path} failed: {error}')
+        elapsed = time.perf_counter() - start
+        eta = elapsed / done * (len(todo) - done)
+        print(f'[{done}/{len(todo)}] {worker_name}: {os.path.basename(source_path)} in {seconds:.0f}s, '
+              f'{failed} failed, eta {eta / 60:.0f} min')
+    for process in processes:
+        process.join()
+
+    summary = {
+        'shard': f'{shard}/{num_shards}',
+        'files': done,
+        'failed': failed,
+        'wall_time': time.perf_counter() - start,
+        'generated_seconds': sum(s.get('generated_seconds', 0.) for s in stats.values()),
+        'workers': stats,
+    }
+    summary['throughput'] = summary['generated_seconds'] / summary['wall_time'] if summary['wall_time'] else 0.
+    print(f'shard summary: {summary}')
+    return summary
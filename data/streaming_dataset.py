@@ -0,0 +1,201 @@
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pretty_midi
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+
+from data import midi_synth
+
+
+def _render_track(midi_path, offsets, segment_seconds, sr, synth, cache):
+    """
+    渲染一首曲目的一组片段：MIDI 只解析一次，各片段按窗口从解析好的音符中渲染，不合成整首
+
+    结果与逐段调用 midi_to_audio_tensor(duration=segment_seconds, offset=offset) 相同（每段按自身峰值归一化），
+    缓存键也相同。失败时对应位置为 None。
+    """
+    keys = [None] * len(offsets)
+    audios = [None] * len(offsets)
+    try:
+        if cache is not None:
+            keys = [cache.key(midi_path, sr, None, True, segment_seconds, synth, offset) for offset in offsets]
+            audios = [cache.load(key) for key in keys]
+        missing = [idx for idx, audio in enumerate(audios) if audio is None]
+        if not missing:
+            return audios
+
+        midi_data = pretty_midi.PrettyMIDI(midi_path)
+        length = int(sr * segment_seconds)
+        notes = midi_synth.collect_notes(midi_data, sr)
+        tables = midi_synth.pitch_wavetables(notes[2], notes[1], sr, dtype=np.float32)
+        for idx in missing:
+            start = int(sr * offsets[idx])
+            audio = midi_synth.render_samples(notes, start, start + length, sr, normalize=False, dtype=np.float32,
+                                              tables=tables)
+            peak = max(audio.max(), -audio.min()) if len(audio) else 0
+            if peak > 0:
+                audio /= peak
+            if keys[idx] is not None:
+                cache.store(keys[idx], audio)
+            audios[idx] = audio
+    except Exception as e:
+        print(f"unable to render {midi_path}: {e}")
+    return audios
+
+
+class PiastStream(IterableDataset):
+    """
+    PIAST 的流式训练数据：逐段产出 (音频片段, 文本标签)
+
+    每首曲目按 segment_seconds 切段（相邻段起点相隔 hop_seconds），每段按窗口渲染，不会在内存中保留整首曲目。
+    一首曲目的片段按最多 prefetch 段一组交给 render_workers 个后台进程，每组只解析一次 MIDI；
+    同时在渲染或等待产出的片段不超过 prefetch 段（加上正在产出的一组）；产出的片段经过 shuffle_buffer 大小的
+    洗牌缓冲。曲目顺序、段的随机偏移和洗牌都由 (seed, epoch, DataLoader worker) 决定，同样的参数得到同样的顺序。
+
+    在 DataLoader(num_workers > 0) 中，每个 DataLoader worker 处理曲目的一个子集，并在本进程内渲染
+    （DataLoader worker 本身就是后台进程，不能再创建子进程）。用 collate 作为 collate_fn。
+    """
+
+    def __init__(self, items, segment_seconds=10., hop_seconds=None, sr=32000, shuffle_buffer=256, seed=0,
+                 render_workers=2, prefetch=8, synth='numpy', cache=None, max_segments_per_track=None,
+                 jitter=True):
+        """
+        参数:
+            items (list): (midi_path, tags, end_time) 列表，end_time 为 None 时解析 MIDI 获得
+            hop_seconds (float): 相邻段的间隔，默认等于 segment_seconds（不重叠）
+            shuffle_buffer (int): 洗牌缓冲的大小，1 表示不打乱片段
+            render_workers (int): 后台渲染进程数，0 表示在当前进程渲染
+            prefetch (int): 最多提前渲染的片段数，也是每个渲染任务的最大片段数
+            synth (str): 只支持 'numpy'（data.midi_synth 按窗口渲染）；pretty_midi 只能合成整首，不适合流式读取
+            cache (data.render_cache.RenderCache): 片段渲染缓存
+            max_segments_per_track (int): 每首曲目每个 epoch 最多取的片段数（随机选择）
+            jitter (bool): 每个 epoch 随机平移切段位置；使用 cache 时应关闭，否则缓存几乎不会命中
+        """
+        self.items = [(path, [tag.strip() for tag in tags], end_time) for path, tags, end_time in items if path]
+        self.segment_seconds = segment_seconds
+        self.hop_seconds = hop_seconds or segment_seconds
+        self.sr = sr
+        self.shuffle_buffer = max(1, shuffle_buffer)
+        self.seed = seed
+        self.render_workers = render_workers
+        self.prefetch = max(1, prefetch)
+        if synth != 'numpy':
+            raise ValueError(f"PiastStream renders windows with synth='numpy', got '{synth}'")
+        self.synth = synth
+        self.cache = cache
+        self.max_segments_per_track = max_segments_per_track
+        self.jitter = jitter
+        # shared memory seen by DataLoader workers, persistent_workers keep the dataset copy they started with;
+        # only the main process writes it, so no lock (a lock would also tie it to one start method)
+        self._epoch = multiprocessing.RawValue('l', 0)
+
+    @classmethod
+    def from_piast(cls, split, **kwargs):
+        """
+        由 load_piast_dataset(build_index=True) 的一个子集创建，使用其中的 end_time 列
+        """
+        end_times = split['end_time'] if 'end_time' in split.column_names else [None] * len(split)
+        return cls(list(zip(split['midi_path'], split['text'], end_times)), **kwargs)
+
+    @property
+    def epoch(self):
+        return self._epoch.value
+
+    def set_epoch(self, epoch):
+        """
+        每个 epoch 开始前调用，改变曲目顺序、段偏移和洗牌；对已启动的 DataLoader worker（persistent_workers）同样生效
+        """
+        self._epoch.value = epoch
+
+    def _count(self, end_time):
+        if end_time < self.segment_seconds:
+            return 0
+        return int((end_time - self.segment_seconds) // self.hop_seconds) + 1
+
+    def _segments(self, rng, items):
+        """
+        返回渲染任务 (path, offsets, tags)，顺序即产出顺序；一首曲目的片段按最多 prefetch 个一组拆成多个任务
+        """
+        segments = []
+        for path, tags, end_time in items:
+            if end_time is None:
+                end_time = pretty_midi.PrettyMIDI(path).get_end_time()
+            count = self._count(end_time)
+            if not count:
+                continue
+            offsets = self.hop_seconds * np.arange(count)
+            if self.jitter:
+                # a random shift within the unused tail, so every epoch sees slightly different windows
+                offsets += rng.uniform(0, end_time - self.segment_seconds - offsets[-1])
+            if self.max_segments_per_track and count > self.max_segments_per_track:
+                offsets = np.sort(rng.choice(offsets, self.max_segments_per_track, replace=False))
+            offsets = [float(offset) for offset in offsets]
+            for start in range(0, len(offsets), self.prefetch):
+                segments.append((path, offsets[start:start + self.prefetch], tags))
+        return segments
+
+    def _rendered(self, segments):
+        args = (self.segment_seconds, self.sr, self.synth, self.cache)
+        if self.render_workers <= 0 or get_worker_info() is not None:
+            for path, offsets, tags in segments:
+                for audio in _render_track(path, offsets, *args):
+                    yield audio, tags
+            return
+        with ProcessPoolExecutor(max_workers=self.render_workers) as executor:
+            pending = collections.deque()
+            queued = 0
+            for path, offsets, tags in segments:
+                # results are taken in submission order; a job is only submitted once it fits in the prefetch
+                # window (in segments), every job holds at most prefetch segments
+                while pending and queued + len(offsets) > self.prefetch:
+                    future, job_tags, count = pending.popleft()
+                    queued -= count
+                    for audio in future.result():
+                        yield audio, job_tags
+                pending.append((executor.submit(_render_track, path, offsets, *args), tags, len(offsets)))
+                queued += len(offsets)
+            while pending:
+                future, tags, _ = pending.popleft()
+                for audio in future.result():
+                    yield audio, tags
+
+    def __iter__(self):
+        worker = get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker is not None else (0, 1)
+        rng = np.random.default_rng([self.seed, self.epoch, worker_id])
+
+        items = self.items[worker_id::num_workers]
+        order = rng.permutation(len(items))
+        segments = self._segments(rng, [items[i] for i in order])
+
+        buffer = []
+        for audio, tags in self._rendered(segments):
+            if audio is None:
+                # _render_track already reported the error
+                continue
+            sample = (torch.from_numpy(audio), tags)
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(sample)
+                continue
+            idx = rng.integers(len(buffer))
+            yield buffer[idx]
+            buffer[idx] = sample
+        for idx in rng.permutation(len(buffer)):
+            yield buffer[idx]
+
+    def num_segments(self):
+        """
+        不限制 max_segments_per_track 时每个 epoch 的片段数
+        """
+        return sum(self._count(end_time) for _, _, end_time in self.items if end_time is not None)
+
+
+def collate(batch):
+    """
+    DataLoader 的 collate_fn：音频堆叠为 [batch, samples]，标签保持为每条一个列表
+    """
+    audio, tags = zip(*batch)
+    return torch.stack(audio), list(tags)
@@ -0,0 +1,85 @@
+import numpy as np
+
+
+def _valid(name):
+    # None, NaN and pd.NA are all "no name"
+    return isinstance(name, str) and bool(name.strip())
+
+
+def similarity_matrix(names, titles, cutoff=0.):
+    """
+    计算提取的曲名与视频标题两两之间的 partial_ratio 相似度（不区分大小写）
+
+    参数:
+        cutoff (float): 低于该值的相似度记为 0，rapidfuzz 可以提前放弃这些配对
+
+    返回:
+        np.ndarray: 形状 (len(names), len(titles)) 的 float32 矩阵，取值 0-1；无效的曲名所在行为 0
+    """
+    valid = [i for i, name in enumerate(names) if _valid(name)]
+    scores = np.zeros((len(names), len(titles)), dtype=np.float32)
+    if not valid or not len(titles):
+        return scores
+    queries = [names[i].lower() for i in valid]
+    choices = [str(title).lower() for title in titles]
+    try:
+        from rapidfuzz import fuzz, process
+
+        # the whole matrix in one call, computed in C across all cores
+        scores[valid] = process.cdist(queries, choices, scorer=fuzz.partial_ratio, score_cutoff=cutoff * 100,
+                                      dtype=np.float32, workers=-1)
+    except ImportError:
+        from fuzzywuzzy import fuzz
+
+        scores[valid] = [[fuzz.partial_ratio(query, choice) for choice in choices] for query in queries]
+    return scores / 100
+
+
+def monotonic_alignment(scores, threshold=0.7):
+    """
+    在相似度矩阵上用动态规划求单调对齐：曲名和标题各自保持原有顺序、一一对应，
+    只允许相似度不低于 threshold 的配对，并使配对的相似度之和最大
+
+    返回:
+        (np.ndarray, np.ndarray): 每个标题对应的曲名下标（未配对为 -1）及其相似度（未配对为 nan）
+    """
+    rows, cols = scores.shape
+    gain = np.where(scores >= threshold, scores, -np.inf)
+    # best[i, j]: best total of the first i names against the first j titles
+    best = np.zeros((rows + 1, cols + 1), dtype=np.float64)
+    for i in range(1, rows + 1):
+        # either pair name i-1 with title j-1, or leave name i-1 out
+        row = np.maximum(best[i - 1, 1:], best[i - 1, :-1] + gain[i - 1])
+        # or leave title j-1 out, every score is positive so this is a running maximum
+        best[i, 1:] = np.maximum.accumulate(row)
+
+    matches = np.full(cols, -1, dtype=np.int64)
+    matched_scores = np.full(cols, np.nan, dtype=np.float32)
+    i, j = rows, cols
+    while i > 0 and j > 0:
+        if best[i, j] == best[i - 1, j]:
+            i -= 1
+        elif best[i, j] == best[i, j - 1]:
+            j -= 1
+        else:
+            matches[j - 1] = i - 1
+            matched_scores[j - 1] = scores[i - 1, j - 1]
+            i -= 1
+            j -= 1
+    return matches, matched_scores
+
+
+def align_names(names, titles, threshold=0.7):
+    """
+    将 LLM 提取的曲名与视频标题对齐
+
+    参数:
+        names (list): 提取的曲名，顺序与 titles 大致对应，可能有缺失、错位或无效项
+        titles (list): 视频标题
+
+    返回:
+        (list, np.ndarray): 每个标题对应的曲名（未配对为 None）及相似度（未配对为 nan）
+    """
+    names, titles = list(names), list(titles)
+    matches, matched_scores = monotonic_alignment(similarity_matrix(names, titles, threshold), threshold)
+    return [names[m] if m >= 0 else None for m in matches], matched_scores
@@ -0,0 +1,180 @@
+import argparse
+import glob
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+# EnCodec codebooks have 2048 entries, uint16 holds every token
+TOKEN_DTYPE = np.uint16
+CHUNK_BYTES = 256 * 1024 ** 2
+
+
+class TokenStore:
+    """
+    生成结果的 EnCodec token 存储：按输出名（与 WAV 同名）索引，可内存映射读取
+
+    token 以 uint16 追加写入分块文件 {writer}-{n}.bin，每块最多 chunk_bytes；每写完一条在
+    index.{writer}.jsonl 追加一行 {name, chunk, offset, codebooks, frames}。一条 30 秒的输出
+    （4 个码本 x 50 帧/秒）只有 12 KB，同样长度的 32 kHz WAV 约 2 MB。
+
+    多个进程用不同的 writer 名写同一个目录，打开时读入目录下所有索引。
+    """
+
+    def __init__(self, store_dir, writer='tokens', chunk_bytes=CHUNK_BYTES):
+        self.store_dir = store_dir
+        self.writer = writer
+        self.chunk_bytes = chunk_bytes
+        os.makedirs(store_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # name -> (chunk file, byte offset, codebooks, frames)
+        self._index = {}
+        for path in sorted(glob.glob(os.path.join(glob.escape(store_dir), 'index.*.jsonl'))):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # interrupted while writing this line, its tokens are not referenced
+                        continue
+                    self._index[entry['name']] = (entry['chunk'], entry['offset'], entry['codebooks'],
+                                                  entry['frames'])
+        chunks = [int(m[1]) for m in (re.fullmatch(rf'{re.escape(writer)}-(\d+)\.bin', name)
+                                      for name in os.listdir(store_dir)) if m]
+        self._chunk_id = max(chunks, default=0)
+        self._chunk = None
+        self._index_file = None
+
+    def _chunk_name(self):
+        return f'{self.writer}-{self._chunk_id:05d}.bin'
+
+    def _open(self):
+        if self._index_file is None:
+            self._index_file = open(os.path.join(self.store_dir, f'index.{self.writer}.jsonl'), 'a',
+                                    encoding='utf-8')
+        # continue the last chunk of this writer, start a new one when it is full
+        while self._chunk is None or self._chunk.tell() >= self.chunk_bytes:
+            if self._chunk is not None:
+                self._chunk.close()
+                self._chunk_id += 1
+            self._chunk = open(os.path.join(self.store_dir, self._chunk_name()), 'ab')
+
+    def put(self, name, tokens):
+        """
+        保存一条输出的 token
+
+        参数:
+            name (str): 输出名，如 {file_name}_part{idx}_{style}
+            tokens: 形状为 [codebooks, frames] 的整数张量或数组
+        """
+        if hasattr(tokens, 'cpu'):
+            tokens = tokens.cpu().numpy()
+        tokens = np.ascontiguousarray(tokens, dtype=TOKEN_DTYPE)
+        if tokens.ndim != 2:
+            raise ValueError(f'expected [codebooks, frames] tokens, got shape {tokens.shape}')
+        codebooks, frames = tokens.shape
+        with self._lock:
+            self._open()
+            offset = self._chunk.tell()
+            self._chunk.write(tokens.tobytes())
+            self._chunk.flush()
+            # the data is on disk before the index line that points to it
+            os.fsync(self._chunk.fileno())
+            entry = {'name': name, 'chunk': self._chunk_name(), 'offset': offset, 'codebooks': codebooks,
+                     'frames': frames}
+            self._index_file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._index_file.flush()
+            self._index[name] = (entry['chunk'], offset, codebooks, frames)
+
+    def get(self, name):
+        """
+        返回形状为 [codebooks, frames] 的只读 uint16 内存映射
+        """
+        chunk, offset, codebooks, frames = self._index[name]
+        return np.memmap(os.path.join(self.store_dir, chunk), dtype=TOKEN_DTYPE, mode='r', offset=offset,
+                         shape=(codebooks, frames))
+
+    def names(self):
+        return list(self._index)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def close(self):
+        with self._lock:
+            for f in (self._chunk, self._index_file):
+                if f is not None:
+                    f.close()
+            self._chunk = self._index_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def load_compression_model(name):
+    """
+    只加载 MusicGen 预训练中的 EnCodec 压缩模型，不加载语言模型和条件器
+
+    参数:
+        name (str): MusicGen 的预训练名，解码时须与生成 token 的模型一致
+    """
+    import torch
+    from audiocraft.models.loaders import load_compression_model as load
+
+    return load(name, device='cuda' if torch.cuda.is_available() else 'cpu')
+
+
+def decode_tokens(model, tokens):
+    """
+    用 EnCodec 压缩模型解码 token，返回形状为 [channels, samples] 的音频
+    """
+    import torch
+
+    # a plain nn.Module, unlike MusicGen it has no device attribute
+    device = next(model.parameters()).device
+    tokens = torch.from_numpy(np.asarray(tokens, dtype=np.int64))[None].to(device)
+    with torch.no_grad():
+        return model.decode(tokens)[0].cpu()
+
+
+def decode_store(store, output_path, names=None, model=None):
+    """
+    把存储中的 token（默认全部）解码为 WAV，已存在的文件跳过
+
+    参数:
+        model: EnCodec 压缩模型（如 MusicGen 的 compression_model），默认只加载 MELODY_MODEL 的压缩模型
+    """
+    from audiocraft.data.audio import audio_write
+
+    from utils.models import MELODY_MODEL, get_model
+
+    # the decoder is a few dozen MB, the language model of melody-large is several GB
+    model = model or get_model(f'{MELODY_MODEL}#compression', loader=lambda _: load_compression_model(MELODY_MODEL))
+    os.makedirs(output_path, exist_ok=True)
+    names = names or store.names()
+    for idx, name in enumerate(names):
+        if os.path.exists(os.path.join(output_path, f'{name}.wav')):
+            continue
+        wav = decode_tokens(model, store.get(name))
+        audio_write(f'{output_path}/{name}', wav, model.sample_rate, strategy="loudness", loudness_compressor=True)
+        print(f'[{idx + 1}/{len(names)}] decoded {name}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='decode stored EnCodec tokens back into WAVs')
+    parser.add_argument('store_dir')
+    parser.add_argument('output_path')
+    parser.add_argument('names', nargs='*', help='output names to decode, all by default')
+    args = parser.parse_args()
+
+    with TokenStore(args.store_dir) as store:
+        print(f'{len(store)} token sequences in {args.store_dir}')
+        decode_store(store, args.output_path, args.names)
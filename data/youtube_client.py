@@ -0,0 +1,170 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# quota units per call of the YouTube Data API v3
+QUOTA_COST = {
+    'search': 100,
+    'videos': 1,
+}
+
+# default daily quota of a YouTube Data API project
+DAILY_QUOTA = 10000
+
+# transient statuses worth retrying, 403 is only retried for rate (not daily quota) limits
+RETRY_STATUS = {429, 500, 502, 503, 504}
+RETRY_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded', 'backendError'}
+
+
+class TokenBucket:
+    """
+    令牌桶限流：每秒补充 rate 个令牌，最多积累 capacity 个；acquire(cost) 在令牌不足时阻塞
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        if cost > self.capacity:
+            raise ValueError(f'cost {cost} exceeds the bucket capacity {self.capacity}')
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= cost:
+                    self._tokens -= cost
+                    return
+                wait = (cost - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _retry_reason(error):
+    try:
+        return error.error_details[0].get('reason')
+    except (AttributeError, IndexError, TypeError):
+        return None
+
+
+class YouTubeClient:
+    """
+    线程池并发的 YouTube Data API 客户端
+
+    每个线程持有自己的 service（httplib2 连接不能跨线程共享，但在线程内复用）；线程池在客户端的整个生命周期内
+    保留，各次 map 共用同一批线程和连接，用完后调用 close() 或使用 with。所有请求经过按配额单位
+    计费的令牌桶（search 100 单位，videos 1 单位），暂时性的 HttpError 按指数退避加随机抖动重试。
+    root_url 可指向本地的桩服务器（见 Test/youtube_stub.py）。传入 cache（data.response_cache.ResponseCache）时
+    命中缓存的请求不消耗配额，也不建立连接。
+    """
+
+    def __init__(self, api_key, workers=8, quota_per_day=DAILY_QUOTA, quota_burst=None, max_retries=5, base_delay=1.,
+                 root_url=None, cache=None):
+        """
+        参数:
+            quota_per_day (int): 项目的每日配额单位，令牌桶按 quota_per_day / 86400 每秒补充
+            quota_burst (int): 令牌桶容量，默认等于 quota_per_day：一次运行最多立即用掉一天的配额，
+                               之后按日配额的速率继续
+        """
+        self.api_key = api_key
+        self.workers = workers
+        self.bucket = TokenBucket(quota_per_day / 86400, quota_burst or quota_per_day)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.root_url = root_url
+        self.cache = cache
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._executor = None
+        self.quota_used = 0
+        self.requests = 0
+        self.retries = 0
+
+    def _service(self):
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            from googleapiclient.discovery import build
+
+            client_options = {'api_endpoint': self.root_url} if self.root_url else None
+            service = build('youtube', 'v3', developerKey=self.api_key, client_options=client_options,
+                            static_discovery=True, cache_discovery=False)
+            self._local.service = service
+        return service
+
+    def execute(self, endpoint, **params):
+        """
+        调用 endpoint（'search' 或 'videos'）的 list 方法并返回响应，失败时重试，重试用尽后抛出 HttpError
+        """
+        if self.cache is not None:
+            return self.cache.fetch(endpoint, params, lambda: self._execute(endpoint, params))
+        return self._execute(endpoint, params)
+
+    def _execute(self, endpoint, params):
+        from googleapiclient.errors import HttpError
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire(QUOTA_COST[endpoint])
+            with self._lock:
+                self.quota_used += QUOTA_COST[endpoint]
+                self.requests += 1
+            try:
+                return getattr(self._service(), endpoint)().list(**params).execute()
+            except HttpError as e:
+                status = e.resp.status
+                transient = status in RETRY_STATUS or (status == 403 and _retry_reason(e) in RETRY_REASONS)
+                if not transient or attempt == self.max_retries:
+                    raise
+                delay = self.base_delay * 2 ** attempt * (1 + random.random())
+                with self._lock:
+                    self.retries += 1
+                print(f'{endpoint} returned {status}, retrying in {delay:.1f}s')
+                time.sleep(delay)
+
+    def search(self, **params):
+        return self.execute('search', **params)
+
+    def videos(self, **params):
+        return self.execute('videos', **params)
+
+    def map(self, fn, items):
+        """
+        在线程池中对每个元素调用 fn，按输入顺序返回结果
+        """
+        items = list(items)
+        # a map called from inside fn would wait on the threads it occupies, it runs in the calling thread
+        if self.workers <= 1 or len(items) <= 1 or getattr(self._local, 'pooled', False):
+            return [fn(item) for item in items]
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='youtube',
+                                                    initializer=self._init_worker)
+            executor = self._executor
+        return list(executor.map(fn, items))
+
+    def _init_worker(self):
+        self._local.pooled = True
+
+    def close(self):
+        """
+        关闭线程池，各线程的 service 和连接随之释放；之后再调用 map 会新建线程池
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def stats(self):
+        stats = {'requests': self.requests, 'retries': self.retries, 'quota_used': self.quota_used}
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        return stats
@@ -1,13 +1,9 @@
-from openunmix import predict
-import torchaudio
-from audiocraft.data.audio import audio_write
+from utils.models import SEPARATOR_MODEL, get_model, separator_name
 
 testSource = "./asset/"
 filename = 'songTest.mp3'
 'umxhq'
 
-melody, sr = torchaudio.load(testSource + filename)
-
 def preprocess(dataset, ):
     separate_song()
     vocal_to_note()
@@ -17,9 +13,18 @@ def preprocess(dataset, ):
     return
 
 
-def separate_song(audio, sr, export: str = None, target=None, modelName="umxl"):
-    separated = predict.separate(audio[None], rate=sr, model_str_or_path=modelName, targets=target)
+def separate_song(audio, sr, export: str = None, target=None, modelName=SEPARATOR_MODEL):
+    from openunmix import predict
+
+    # the separator is loaded once per process (and per target subset) instead of on every call
+    separator = get_model(separator_name(modelName, target))
+    separated = predict.separate(audio[None], rate=sr, separator=separator)
+    if target:
+        # only what was asked for, not the residual the subset separator adds
+        separated = {name: separated[name] for name in ([target] if isinstance(target, str) else target)}
     if export is not None:
+        from audiocraft.data.audio import audio_write
+
         for name, tensor in zip(separated.keys(), separated.values()):
             # Will save under {modelName}.{export}.{name}.wav, with loudness normalization at -14 db LUFS.
             audio_write(f'{modelName}.{export}.{name}', tensor[0].cpu(), sr, strategy="loudness",
@@ -42,3 +47,9 @@ def slice():
 
 def speedShift():
     return
+
+
+if __name__ == '__main__':
+    import torchaudio
+
+    melody, sr = torchaudio.load(testSource + filename)
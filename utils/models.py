@@ -0,0 +1,148 @@
+import gc
+import os
+import threading
+
+MELODY_MODEL = 'facebook/musicgen-melody-large'
+SEPARATOR_MODEL = 'umxl'
+
+# inference profiles for MusicGen, picked with set_profile() or the MUSICGEN_PROFILE environment variable
+#   device: None lets audiocraft choose (cuda when available)
+#   threads / interop_threads: torch intra-op / inter-op threads, None keeps torch's default
+#   quantize: dynamic int8 quantization of the nn.Linear layers of the transformer and output heads (CPU only)
+#   compile: torch.compile the transformer layers
+PROFILES = {
+    'default': {'device': None, 'threads': None, 'interop_threads': None, 'quantize': False, 'compile': False},
+    'cpu': {'device': 'cpu', 'threads': os.cpu_count(), 'interop_threads': 1, 'quantize': False, 'compile': False},
+    'cpu-int8': {'device': 'cpu', 'threads': os.cpu_count(), 'interop_threads': 1, 'quantize': True,
+                 'compile': False},
+    'cpu-int8-compile': {'device': 'cpu', 'threads': os.cpu_count(), 'interop_threads': 1, 'quantize': True,
+                         'compile': True},
+}
+
+_models = {}
+_lock = threading.Lock()
+_profile = os.environ.get('MUSICGEN_PROFILE', 'default')
+
+
+def set_profile(name):
+    """
+    选择 MusicGen 的推理配置（PROFILES 中的名字）；已按其他配置加载的 MusicGen 会被释放
+    """
+    global _profile
+    if name not in PROFILES:
+        raise ValueError(f'unknown profile {name}, expected one of {list(PROFILES)}')
+    # spawned worker processes (data.shard_runner) start with the same profile
+    os.environ['MUSICGEN_PROFILE'] = name
+    if name != _profile:
+        _profile = name
+        for model_name in loaded_models():
+            if 'musicgen' in model_name:
+                drop_model(model_name)
+
+
+def get_profile():
+    return _profile
+
+
+def apply_profile(model, profile):
+    """
+    按配置调整已加载的 MusicGen：线程数、语言模型的动态 int8 量化、编译
+    """
+    import torch
+
+    if profile['threads']:
+        torch.set_num_threads(profile['threads'])
+    if profile['interop_threads']:
+        try:
+            torch.set_num_interop_threads(profile['interop_threads'])
+        except RuntimeError:
+            # can only be set once, before any inter-op parallel work
+            pass
+    if profile['quantize']:
+        if model.device.type != 'cpu':
+            raise ValueError('dynamic int8 quantization runs on CPU only')
+        # the attention input projections are raw parameters, the feed-forward and output linears are quantized.
+        # the conditioners run once per generation and read output_proj.weight as a tensor, they stay float
+        for module in [model.lm.transformer, model.lm.linears]:
+            torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    if profile['compile']:
+        for layer in model.lm.transformer.layers:
+            # the KV cache grows every step, dynamic shapes avoid recompiling per length
+            layer.forward = torch.compile(layer.forward, dynamic=True)
+    return model
+
+
+def _load_musicgen(name):
+    from audiocraft.models import MusicGen
+
+    profile = PROFILES[_profile]
+    model = MusicGen.get_pretrained(name, device=profile['device'])
+    print(f'{name}: inference profile {_profile}')
+    return apply_profile(model, profile)
+
+
+def separator_name(name=SEPARATOR_MODEL, targets=None):
+    """
+    Open-Unmix 分离器在注册表中的名字：给出 targets（str 或 list）时为 'umxl:vocals,other'，只加载这些目标，
+    其余部分作为 residual 输出
+    """
+    if not targets:
+        return name
+    targets = [targets] if isinstance(targets, str) else list(targets)
+    return f'{name}:{",".join(targets)}'
+
+
+def _load_separator(name):
+    from openunmix import utils
+
+    # predict.separate ignores targets= when given a separator, they have to be chosen when it is loaded;
+    # with a subset the rest of the mix becomes a 'residual' target, the EM post-processing needs two or more
+    model_name, _, targets = name.partition(':')
+    separator = utils.load_separator(model_str_or_path=model_name, targets=targets.split(',') if targets else None,
+                                     residual=bool(targets))
+    # what openunmix.predict.separate does with a separator it loads itself
+    separator.freeze()
+    return separator
+
+
+def _default_loader(name):
+    if 'musicgen' in name:
+        return _load_musicgen
+    if name.startswith('umx'):
+        return _load_separator
+    raise ValueError(f'no loader for model {name}, pass one to get_model')
+
+
+def get_model(name=MELODY_MODEL, loader=None):
+    """
+    进程内的模型注册表：第一次使用时才加载，之后按名字返回同一个实例
+
+    参数:
+        name (str): MusicGen 的预训练名（如 facebook/musicgen-melody-large）或 Open-Unmix 模型名（如 umxl，见 separator_name）
+        loader (callable): 自定义加载函数 loader(name)，默认按名字选择；MusicGen 按当前的推理配置加载
+    """
+    with _lock:
+        if name not in _models:
+            print(f'loading model {name}...')
+            _models[name] = (loader or _default_loader(name))(name)
+        return _models[name]
+
+
+def drop_model(name=None):
+    """
+    释放一个（name 为 None 时全部）已加载的模型
+    """
+    with _lock:
+        if name is None:
+            _models.clear()
+        else:
+            _models.pop(name, None)
+    gc.collect()
+    import torch
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def loaded_models():
+    with _lock:
+        return list(_models)